@@ -6,6 +6,7 @@ from flask_limiter.util import get_remote_address
 from flask_jwt_extended import JWTManager
 import pyodbc
 import os
+from app.config import Config
 
 db = SQLAlchemy()
 login_manager = LoginManager()
@@ -16,12 +17,42 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
     
+    # Time connection checkouts for /metrics; copied so the Config class dict is not mutated.
+    from app.metrics import TimedQueuePool
+    engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    engine_options.setdefault('poolclass', TimedQueuePool)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
 
     db.init_app(app)
     login_manager.init_app(app)
     limiter.init_app(app)
     jwt.init_app(app)
 
+    from app import exam_cache
+    from app.audit import audit
+    from app.heartbeat import monitor
+    from app.presence import presence
+    from app.autosave import autosave_buffer
+    from app.grading_queue import grading_queue
+    from app.authz import authz
+    from app.identity import principals
+    from app.passwords import password_hasher
+    from app.deadlines import deadline_sweeper
+    from app.querystats import query_profiler
+    from app.metrics import request_metrics
+    audit.init_app(app)
+    exam_cache.init_app(app)
+    monitor.init_app(app)
+    presence.init_app(app)
+    autosave_buffer.init_app(app)
+    grading_queue.init_app(app)
+    authz.init_app(app)
+    principals.init_app(app)
+    password_hasher.init_app(app)
+    deadline_sweeper.init_app(app)
+    query_profiler.init_app(app)
+    request_metrics.init_app(app)
+
     login_manager.login_view = 'auth.login'
     login_manager.login_message_category = 'info'
     
@@ -31,20 +62,21 @@ def create_app(config_class=Config):
     from app.exams import exams as exams_blueprint
     from app.grading import grading as grading_blueprint
     from app.heartbeat import heartbeat as heartbeat_blueprint
+    from app.api_auth import api_auth as api_auth_blueprint
     
     app.register_blueprint(auth_blueprint)
     app.register_blueprint(courses_blueprint)
     app.register_blueprint(exams_blueprint)
     app.register_blueprint(grading_blueprint)
     app.register_blueprint(heartbeat_blueprint)
+    app.register_blueprint(api_auth_blueprint)
     
     # Create database tables
     with app.app_context():
         db.create_all()
         
-        # Schedule periodic tasks
-        from app.utils import scheduler
-        scheduler.init_app(app)
-        scheduler.start()
+        # Schedule periodic tasks; a no-op if this process already started the scheduler
+        from app.utils import init_scheduled_tasks
+        init_scheduled_tasks(app)
     
     return app
\ No newline at end of file
@@ -0,0 +1,68 @@
+from app.models import db, Answer, ExamAttempt
+
+
+ANSWER_FIELDS = ('answer_text', 'selected_option_id')
+
+# SQL Server allows at most 2100 parameters per statement.
+IN_CHUNK_SIZE = 1000
+
+
+def chunked(values, size=IN_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def in_progress_attempts(attempt_ids):
+    """Return the subset of attempt ids that are still in progress."""
+    open_ids = set()
+    for chunk in chunked(attempt_ids):
+        open_ids.update(row.attempt_id for row in db.session.query(ExamAttempt.attempt_id).filter(
+            ExamAttempt.attempt_id.in_(chunk),
+            ExamAttempt.status == 'in_progress'
+        ))
+    return open_ids
+
+
+def upsert_answers(rows):
+    """Insert or update answers in bulk without committing.
+
+    Each row is a dict with attempt_id, question_id and any of answer_text /
+    selected_option_id; later rows for the same (attempt, question) win.
+    Existing answers are loaded with one query and the writes go out as
+    batched executemany statements, so the caller owns the transaction.
+    """
+    latest = {}
+    for row in rows:
+        latest[(row['attempt_id'], row['question_id'])] = row
+    if not latest:
+        return 0
+
+    question_ids = {question_id for _, question_id in latest}
+    existing = {}
+    for attempt_ids in chunked({attempt_id for attempt_id, _ in latest}):
+        query = db.session.query(
+            Answer.answer_id, Answer.attempt_id, Answer.question_id
+        ).filter(Answer.attempt_id.in_(attempt_ids))
+        if len(question_ids) <= IN_CHUNK_SIZE:
+            query = query.filter(Answer.question_id.in_(question_ids))
+        for answer_id, attempt_id, question_id in query:
+            existing[(attempt_id, question_id)] = answer_id
+
+    inserts = []
+    updates = []
+    for key, row in latest.items():
+        values = {field: row[field] for field in ANSWER_FIELDS if field in row}
+        answer_id = existing.get(key)
+        if answer_id is None:
+            values['attempt_id'], values['question_id'] = key
+            inserts.append(values)
+        elif values:
+            values['answer_id'] = answer_id
+            updates.append(values)
+
+    if inserts:
+        db.session.bulk_insert_mappings(Answer, inserts)
+    if updates:
+        db.session.bulk_update_mappings(Answer, updates)
+    return len(inserts) + len(updates)
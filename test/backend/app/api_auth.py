@@ -0,0 +1,135 @@
+from collections import namedtuple
+from datetime import datetime
+from functools import wraps
+from flask import Blueprint, jsonify, request, g
+from flask_login import current_user
+from flask_jwt_extended import (
+    create_access_token, create_refresh_token, get_jwt, get_jwt_identity,
+    jwt_required, verify_jwt_in_request
+)
+from app import db, jwt, limiter
+from app.models import User, RevokedToken
+from app.audit import audit
+from app.authz import authz
+from app.passwords import PasswordHasherBusy
+
+api_auth = Blueprint('api_auth', __name__)
+
+
+class ApiPrincipal(namedtuple('ApiPrincipal', ['user_id', 'role', 'courses'])):
+    """Caller identity for JSON endpoints.
+
+    For bearer tokens everything comes from the signed claims, so identity
+    and course checks need no database access. For session callers courses
+    is None and membership falls back to the authorization cache.
+    """
+
+    __slots__ = ()
+
+    def in_course(self, course_id):
+        if self.role == 'admin':
+            return True
+        if self.courses is not None:
+            return course_id in self.courses
+        return authz.is_member(self.user_id, course_id)
+
+
+def _issue_tokens(user, refresh=True):
+    claims = {
+        'role': user.role,
+        'courses': sorted(authz.memberships(user.user_id))
+    }
+    tokens = {'access_token': create_access_token(identity=str(user.user_id), additional_claims=claims)}
+    if refresh:
+        tokens['refresh_token'] = create_refresh_token(identity=str(user.user_id))
+    return tokens
+
+
+def _has_bearer_token():
+    return request.headers.get('Authorization', '').startswith('Bearer ')
+
+
+def api_login_required(roles=None):
+    """Accept a bearer access token, or an existing flask_login session, for JSON endpoints."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if _has_bearer_token():
+                verify_jwt_in_request()
+                claims = get_jwt()
+                principal = ApiPrincipal(int(get_jwt_identity()), claims['role'], frozenset(claims['courses']))
+            elif current_user.is_authenticated:
+                principal = ApiPrincipal(current_user.user_id, current_user.role, None)
+            else:
+                return jsonify({'error': 'Authentication required.'}), 401
+
+            if roles and principal.role not in roles:
+                return jsonify({'error': 'You do not have permission to access this resource.'}), 403
+            g.principal = principal
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+@jwt.token_in_blocklist_loader
+def check_revoked(jwt_header, jwt_payload):
+    # Access tokens are short-lived and never hit the database; only refresh tokens are checked.
+    if jwt_payload.get('type') != 'refresh':
+        return False
+    return db.session.query(RevokedToken.token_id).filter(
+        RevokedToken.jti == jwt_payload['jti']
+    ).first() is not None
+
+
+@api_auth.route('/api/auth/token', methods=['POST'])
+@limiter.limit('10 per minute')
+def issue_token():
+    payload = request.get_json(silent=True) or {}
+    username = payload.get('username')
+    password = payload.get('password')
+    if not username or not password:
+        return jsonify({'error': 'username and password are required.'}), 400
+
+    user = User.query.filter_by(username=username).first()
+    try:
+        valid = user is not None and user.check_password(password)
+    except PasswordHasherBusy:
+        return jsonify({'error': 'The server is busy. Please try again in a moment.'}), 503
+
+    if not valid or not user.is_active:
+        audit.record(
+            action='failed_login',
+            new_values={'message': f'Failed token request for username: {username}'}
+        )
+        return jsonify({'error': 'Invalid credentials.'}), 401
+
+    if user.upgrade_password_hash(password):
+        db.session.commit()
+    audit.record(user_id=user.user_id, action='token_login')
+    return jsonify(_issue_tokens(user))
+
+
+@api_auth.route('/api/auth/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh_token():
+    # Role, active flag and enrollments are re-read here so access tokens pick up changes.
+    user = User.query.get(int(get_jwt_identity()))
+    if user is None or not user.is_active:
+        return jsonify({'error': 'Account is not active.'}), 401
+    authz.invalidate(user.user_id)
+    return jsonify(_issue_tokens(user, refresh=False))
+
+
+@api_auth.route('/api/auth/revoke', methods=['POST'])
+@jwt_required(refresh=True)
+def revoke_token():
+    claims = get_jwt()
+    db.session.add(RevokedToken(
+        jti=claims['jti'],
+        token_type=claims['type'],
+        user_id=int(get_jwt_identity()),
+        expires_at=datetime.utcfromtimestamp(claims['exp']) if claims.get('exp') else None
+    ))
+    db.session.commit()
+    audit.record(user_id=int(get_jwt_identity()), action='revoke_token')
+    return jsonify({'revoked': True})
@@ -0,0 +1,291 @@
+import json
+import zlib
+from datetime import datetime
+from time import perf_counter
+from sqlalchemy import func
+from app.models import db, ExamAttempt, Answer, ArchivedExam
+from app.storage import get_object_store, resolve_location, checksum
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+STREAM_BATCH_SIZE = 1000
+
+
+def available_codec(codec):
+    """Fall back to gzip when zstd is requested but zstandard is not installed."""
+    if codec == 'zstd' and zstandard is None:
+        return 'gzip'
+    return codec
+
+
+def _compressor(codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor().compressobj()
+    # wbits=31 writes a gzip container.
+    return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+
+def _decompressor(codec):
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(31)
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _number(value):
+    return float(value) if value is not None else None
+
+
+def iter_exam_records(exam):
+    """Yield the exam header and then one record per graded attempt.
+
+    Attempts and answers come from a single ordered join streamed in
+    batches, so memory stays bounded by one attempt.
+    """
+    yield {
+        'type': 'exam',
+        'exam_id': exam.exam_id,
+        'exam_name': exam.exam_name,
+        'course_id': exam.course_id,
+        'created_at': _iso(exam.created_at)
+    }
+
+    rows = db.session.query(
+        ExamAttempt.attempt_id,
+        ExamAttempt.user_id,
+        ExamAttempt.start_time,
+        ExamAttempt.submission_time,
+        ExamAttempt.total_score,
+        Answer.question_id,
+        Answer.answer_text,
+        Answer.selected_option_id,
+        Answer.points_awarded,
+        Answer.feedback,
+        Answer.graded_at
+    ).outerjoin(
+        Answer, Answer.attempt_id == ExamAttempt.attempt_id
+    ).filter(
+        ExamAttempt.exam_id == exam.exam_id,
+        ExamAttempt.status == 'graded'
+    ).order_by(
+        ExamAttempt.attempt_id, Answer.question_id
+    ).yield_per(STREAM_BATCH_SIZE)
+
+    current = None
+    for row in rows:
+        if current is None or current['attempt_id'] != row.attempt_id:
+            if current is not None:
+                yield current
+            current = {
+                'type': 'attempt',
+                'attempt_id': row.attempt_id,
+                'user_id': row.user_id,
+                'start_time': _iso(row.start_time),
+                'submission_time': _iso(row.submission_time),
+                'total_score': _number(row.total_score),
+                'answers': []
+            }
+        if row.question_id is not None:
+            current['answers'].append({
+                'question_id': row.question_id,
+                'answer_text': row.answer_text,
+                'selected_option_id': row.selected_option_id,
+                'points_awarded': _number(row.points_awarded),
+                'feedback': row.feedback,
+                'graded_at': _iso(row.graded_at)
+            })
+    if current is not None:
+        yield current
+
+
+def _compress(data, codec):
+    compressor = _compressor(codec)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decompress(data, codec):
+    return _decompressor(codec).decompress(data)
+
+
+def encode_records(records, codec='gzip'):
+    """Compress records as newline-delimited JSON; returns (payload, index, stats).
+
+    Every record is written as its own gzip member / zstd frame. The
+    concatenation is still a valid stream, and the index maps each
+    attempt_id to the (offset, length) of its member and each user_id to
+    their attempt ids, so one attempt can be read without the rest.
+    """
+    started = perf_counter()
+    chunks = []
+    offset = 0
+    raw_bytes = 0
+    count = 0
+    index = {'header': None, 'attempts': {}, 'users': {}}
+    for record in records:
+        line = json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+        member = _compress(line, codec)
+        span = [offset, len(member)]
+        if record.get('type') == 'attempt':
+            index['attempts'][str(record['attempt_id'])] = span
+            index['users'].setdefault(str(record['user_id']), []).append(record['attempt_id'])
+        elif index['header'] is None:
+            index['header'] = span
+        chunks.append(member)
+        offset += len(member)
+        raw_bytes += len(line)
+        count += 1
+    payload = b''.join(chunks)
+    return payload, index, {
+        'records': count,
+        'raw_bytes': raw_bytes,
+        'stored_bytes': len(payload),
+        'seconds': perf_counter() - started
+    }
+
+
+def decode_member(data, codec):
+    """Decode one compressed record slice."""
+    return json.loads(_decompress(data, codec))
+
+
+def _iter_members(payload, codec):
+    # Unindexed payloads: walk the concatenated members one after another.
+    data = payload
+    while data:
+        decompressor = _decompressor(codec)
+        chunk = decompressor.decompress(data)
+        data = getattr(decompressor, 'unused_data', b'')
+        yield chunk
+        if not getattr(decompressor, 'eof', True):
+            break
+
+
+def load_payload(archive):
+    """Return the compressed payload, fetching it from the object store if tiered."""
+    if not archive.storage_location:
+        return archive.payload
+    store, key = resolve_location(archive.storage_location)
+    payload = store.get(key)
+    if checksum(payload) != archive.checksum:
+        raise IOError(f'Checksum mismatch for archive {archive.archive_id} at {archive.storage_location}')
+    return payload
+
+
+def iter_archive(archive):
+    """Yield the records of an archive, whichever format or tier it is stored in."""
+    payload = load_payload(archive)
+    if payload is None:
+        # Legacy archives hold one JSON document in exam_data.
+        data = json.loads(archive.exam_data or '{}')
+        yield dict(data.get('exam_info', {}), type='exam')
+        for attempt in data.get('attempts', []):
+            yield dict(attempt, type='attempt')
+        return
+
+    if archive.payload_index:
+        index = json.loads(archive.payload_index)
+        spans = sorted([index['header']] + list(index['attempts'].values()))
+        for offset, length in spans:
+            yield decode_member(payload[offset:offset + length], archive.payload_codec)
+        return
+
+    buffer = b''
+    for chunk in _iter_members(payload, archive.payload_codec):
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        for line in lines:
+            if line:
+                yield json.loads(line)
+    if buffer.strip():
+        yield json.loads(buffer)
+
+
+def _load_index(archive_id):
+    row = db.session.query(
+        ArchivedExam.payload_index, ArchivedExam.payload_codec, ArchivedExam.storage_location
+    ).filter(ArchivedExam.archive_id == archive_id).first()
+    if row is None or not row.payload_index:
+        return None, None, None
+    return json.loads(row.payload_index), row.payload_codec, row.storage_location
+
+
+def _read_slice(archive_id, offset, length, location=None):
+    if location:
+        # Tiered payloads are read with a ranged GET; each member carries its own CRC.
+        store, key = resolve_location(location)
+        return store.get(key, offset, length)
+    # SUBSTRING on VARBINARY(MAX) returns just the requested bytes (1-based offset).
+    return db.session.query(
+        func.substring(ArchivedExam.payload, offset + 1, length)
+    ).filter(ArchivedExam.archive_id == archive_id).scalar()
+
+
+def read_archived_attempt(archive_id, attempt_id):
+    """Return one archived attempt record, decompressing only its slice."""
+    index, codec, location = _load_index(archive_id)
+    if index is None:
+        archive = ArchivedExam.query.get(archive_id)
+        if archive is None:
+            return None
+        return next((record for record in iter_archive(archive)
+                     if record.get('type') == 'attempt' and record.get('attempt_id') == attempt_id), None)
+
+    span = index['attempts'].get(str(attempt_id))
+    if span is None:
+        return None
+    return decode_member(_read_slice(archive_id, *span, location=location), codec)
+
+
+def read_archived_user_attempts(archive_id, user_id):
+    """Return every archived attempt of one user."""
+    index, _, _ = _load_index(archive_id)
+    if index is None:
+        archive = ArchivedExam.query.get(archive_id)
+        if archive is None:
+            return []
+        return [record for record in iter_archive(archive)
+                if record.get('type') == 'attempt' and record.get('user_id') == user_id]
+
+    return [read_archived_attempt(archive_id, attempt_id)
+            for attempt_id in index['users'].get(str(user_id), [])]
+
+
+def tier_archive(archive, codec='gzip'):
+    """Move an archive payload to the object store, leaving a stub row behind.
+
+    Legacy JSON archives are re-encoded as indexed members on the way out.
+    The stored object is read back and checksummed before the database copy
+    is dropped. Does not commit.
+    """
+    if archive.storage_location:
+        return None
+    if archive.payload is None:
+        payload, index, stats = encode_records(iter_archive(archive), codec)
+        archive.payload_codec = codec
+        archive.payload_index = json.dumps(index, separators=(',', ':'))
+        archive.raw_bytes = stats['raw_bytes']
+    else:
+        payload = archive.payload
+
+    digest = checksum(payload)
+    store = get_object_store()
+    key = f'archives/{archive.exam_id}/{archive.archive_id}.ndjson.{archive.payload_codec}'
+    location = store.put(key, payload)
+    if checksum(store.get(key)) != digest:
+        store.delete(key)
+        raise IOError(f'Checksum mismatch after uploading archive {archive.archive_id}')
+
+    archive.storage_location = location
+    archive.checksum = digest
+    archive.stored_bytes = len(payload)
+    archive.tiered_at = datetime.utcnow()
+    archive.payload = None
+    archive.exam_data = None
+    return location
@@ -0,0 +1,134 @@
+import atexit
+import json
+from datetime import datetime
+from queue import Queue, Empty, Full
+from threading import Lock, Thread
+from flask import request, has_request_context
+from app.models import db, AuditLog
+
+
+def serialize_values(values):
+    """Store audit payloads as compact JSON; strings are kept as given."""
+    if values is None or isinstance(values, str):
+        return values
+    return json.dumps(values, default=str, separators=(',', ':'))
+
+
+class AuditSink:
+    """Batched audit-log writer.
+
+    record() pushes events onto a bounded queue that a background thread
+    bulk-inserts every few seconds. Events recorded with sync=True are added
+    to the current session instead, so they commit (or roll back) together
+    with the caller's business transaction.
+    """
+
+    def __init__(self, max_size=10000, batch_size=500, flush_seconds=2):
+        self.app = None
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._queue = Queue(maxsize=max_size)
+        self._lock = Lock()
+        self._thread = None
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.max_size = app.config.get('AUDIT_QUEUE_SIZE', self.max_size)
+        self.batch_size = app.config.get('AUDIT_BATCH_SIZE', self.batch_size)
+        self.flush_seconds = app.config.get('AUDIT_FLUSH_SECONDS', self.flush_seconds)
+        self._queue = Queue(maxsize=self.max_size)
+        self._thread = Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def record(self, action, user_id=None, entity_type=None, entity_id=None,
+               old_values=None, new_values=None, sync=False):
+        """Record an audit event; returns False if it was dropped because the queue is full."""
+        event = {
+            'user_id': user_id,
+            'action': action,
+            'entity_type': entity_type,
+            'entity_id': entity_id,
+            'old_values': serialize_values(old_values),
+            'new_values': serialize_values(new_values),
+            'ip_address': request.remote_addr if has_request_context() else None,
+            'user_agent': request.headers.get('User-Agent') if has_request_context() else None,
+            'created_at': datetime.utcnow()
+        }
+
+        if sync or self._thread is None:
+            db.session.add(AuditLog(**event))
+            return True
+
+        try:
+            self._queue.put_nowait(event)
+        except Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            'depth': self.depth(),
+            'capacity': self.max_size,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed
+        }
+
+    def _take_batch(self, timeout):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=timeout))
+        except Empty:
+            return batch
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def flush(self):
+        """Synchronously write everything currently queued (outside request threads)."""
+        while True:
+            batch = self._take_batch(timeout=0)
+            if not batch:
+                return
+            self._write(batch)
+
+    def _run(self):
+        while True:
+            batch = self._take_batch(timeout=self.flush_seconds)
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        with self.app.app_context():
+            try:
+                db.session.execute(AuditLog.__table__.insert(), batch)
+                db.session.commit()
+                with self._lock:
+                    self.written += len(batch)
+            except Exception as e:
+                db.session.rollback()
+                with self._lock:
+                    self.failed += len(batch)
+                self.app.logger.error(f"Error writing {len(batch)} audit events: {str(e)}")
+            finally:
+                db.session.remove()
+
+
+audit = AuditSink()
@@ -1,7 +1,9 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from app.models import User, AuditLog
+from app.models import User
+from app.audit import audit
+from app.passwords import PasswordHasherBusy
 from app import db, login_manager
 from app import LoginForm, RegistrationForm
 from datetime import datetime
@@ -18,38 +20,38 @@ def login():
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
         
-        if user and user.check_password(form.password.data):
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+        except PasswordHasherBusy:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('auth/login.html', title='Login', form=form), 503
+        
+        if valid:
             if not user.is_active:
                 flash('Your account has been deactivated.', 'danger')
                 return redirect(url_for('auth.login'))
             
+            # Legacy PBKDF2 or low-cost hash: upgrade while we have the plaintext.
+            user.upgrade_password_hash(form.password.data)
             login_user(user, remember=form.remember.data)
             user.last_login = datetime.utcnow()
             db.session.commit()
             
             # Log the login event
-            audit_log = AuditLog(
+            audit.record(
                 user_id=user.user_id,
-                action='login',
-                ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent')
+                action='login'
             )
-            db.session.add(audit_log)
-            db.session.commit()
             
             next_page = request.args.get('next')
             flash('You have been logged in!', 'success')
             return redirect(next_page or url_for('main.index'))
         else:
             # Log failed login attempt
-            audit_log = AuditLog(
+            audit.record(
                 action='failed_login',
-                ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent'),
-                message=f'Failed login attempt for username: {form.username.data}'
+                new_values={'message': f'Failed login attempt for username: {form.username.data}'}
             )
-            db.session.add(audit_log)
-            db.session.commit()
             
             flash('Login unsuccessful. Please check username and password.', 'danger')
     
@@ -75,19 +77,19 @@ def register():
             last_name=form.last_name.data,
             role='student'
         )
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except PasswordHasherBusy:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('auth/register.html', title='Register', form=form), 503
         
         db.session.add(user)
         db.session.commit()
 
-        audit_log = AuditLog(
+        audit.record(
             user_id=user.user_id,
-            action='register',
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent')
+            action='register'
         )
-        db.session.add(audit_log)
-        db.session.commit()
         
         flash('Your account has been created! You can now log in.', 'success')
         return redirect(url_for('auth.login'))
@@ -98,14 +100,10 @@ def register():
 @login_required
 def logout():
 
-    audit_log = AuditLog(
+    audit.record(
         user_id=current_user.user_id,
-        action='logout',
-        ip_address=request.remote_addr,
-        user_agent=request.headers.get('User-Agent')
+        action='logout'
     )
-    db.session.add(audit_log)
-    db.session.commit()
     
     logout_user()
     flash('You have been logged out.', 'info')
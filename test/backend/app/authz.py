@@ -0,0 +1,68 @@
+from time import monotonic
+from flask import g, has_app_context
+from app.models import db, CourseEnrollment
+from app.exam_cache import LRUCache
+
+
+class CourseAuthz:
+    """Course membership lookups for authorization checks.
+
+    A user's memberships ({course_id: role}) are loaded with one query and
+    memoized on flask.g for the rest of the request, and shared across
+    requests through a short-TTL LRU cache. Writers that change enrollments
+    call invalidate() so their own process sees the change immediately.
+    """
+
+    def __init__(self, ttl_seconds=60, max_size=10000):
+        self.ttl_seconds = ttl_seconds
+        self._cache = LRUCache(max_size)
+
+    def init_app(self, app):
+        self.ttl_seconds = app.config.get('AUTHZ_CACHE_TTL', self.ttl_seconds)
+        self._cache = LRUCache(app.config.get('AUTHZ_CACHE_SIZE', self._cache.maxsize))
+
+    def _load(self, user_id):
+        rows = db.session.query(
+            CourseEnrollment.course_id, CourseEnrollment.role
+        ).filter(CourseEnrollment.user_id == user_id)
+        return {row.course_id: row.role for row in rows}
+
+    def memberships(self, user_id):
+        """Return {course_id: role} for a user."""
+        per_request = g.setdefault('course_memberships', {}) if has_app_context() else {}
+        memberships = per_request.get(user_id)
+        if memberships is not None:
+            return memberships
+
+        cached = self._cache.get(user_id)
+        if cached is not None and cached[0] > monotonic():
+            memberships = cached[1]
+        else:
+            memberships = self._load(user_id)
+            self._cache.put(user_id, (monotonic() + self.ttl_seconds, memberships))
+        per_request[user_id] = memberships
+        return memberships
+
+    def course_role(self, user_id, course_id):
+        return self.memberships(user_id).get(course_id)
+
+    def is_member(self, user_id, course_id):
+        return course_id in self.memberships(user_id)
+
+    def is_professor(self, user_id, course_id):
+        return self.course_role(user_id, course_id) == 'professor'
+
+    def invalidate(self, user_id):
+        self._cache.pop(user_id)
+        if has_app_context():
+            g.get('course_memberships', {}).pop(user_id, None)
+
+    def stats(self):
+        return {
+            'size': len(self._cache),
+            'hits': self._cache.hits,
+            'misses': self._cache.misses
+        }
+
+
+authz = CourseAuthz()
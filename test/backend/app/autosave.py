@@ -0,0 +1,136 @@
+from threading import Lock
+from time import monotonic
+from flask import current_app, has_app_context
+from app.models import db
+from app.answers import upsert_answers, in_progress_attempts, ANSWER_FIELDS
+
+
+class AutosaveBuffer:
+    """Bounded write-behind buffer for in-progress answers.
+
+    Only the latest delta per (attempt_id, question_id) is kept; deltas with
+    a client sequence number lower than one already seen are dropped. Both
+    maps are keyed by attempt_id. Sequence numbers of attempts found closed
+    on flush, or idle for idle_seconds and then found closed, are forgotten.
+    """
+
+    def __init__(self, max_entries=10000, idle_seconds=300):
+        self.app = None
+        self.max_entries = max_entries
+        self.idle_seconds = idle_seconds
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._pending = {}
+        self._size = 0
+        self._seqs = {}
+        self._touched = {}
+        self.flushed = 0
+        self.flush_errors = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.max_entries = app.config.get('AUTOSAVE_BUFFER_SIZE', self.max_entries)
+        self.idle_seconds = app.config.get('AUTOSAVE_IDLE_SECONDS', self.idle_seconds)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, attempt_id, question_id, seq, values):
+        """Buffer a delta; returns False if it is older than one already seen."""
+        with self._lock:
+            seqs = self._seqs.setdefault(attempt_id, {})
+            if seq <= seqs.get(question_id, -1):
+                return False
+            seqs[question_id] = seq
+            self._touched[attempt_id] = monotonic()
+            row = {'attempt_id': attempt_id, 'question_id': question_id}
+            row.update((field, values[field]) for field in ANSWER_FIELDS if field in values)
+            rows = self._pending.setdefault(attempt_id, {})
+            if question_id not in rows:
+                self._size += 1
+            rows[question_id] = row
+            full = self._size >= self.max_entries
+
+        if full:
+            # Backpressure: the writer that fills the buffer pays for the flush.
+            self.flush()
+        return True
+
+    def _forget(self, attempt_ids):
+        # Caller holds self._lock.
+        for attempt_id in attempt_ids:
+            self._seqs.pop(attempt_id, None)
+            self._touched.pop(attempt_id, None)
+
+    def drain(self, attempt_id):
+        """Remove and return buffered rows for one attempt and forget its sequence numbers."""
+        # Waiting for an in-flight flush keeps it from landing after the caller's write.
+        with self._flush_lock, self._lock:
+            rows = list(self._pending.pop(attempt_id, {}).values())
+            self._size -= len(rows)
+            self._forget([attempt_id])
+        return rows
+
+    def flush_attempt(self, attempt_id):
+        """Write one attempt's buffered rows now instead of on the next flush."""
+        with self._flush_lock:
+            with self._lock:
+                rows = self._pending.pop(attempt_id, None)
+                self._size -= len(rows) if rows else 0
+            if not rows:
+                return 0
+            return self._write({attempt_id: rows}, set())
+
+    def flush(self):
+        """Write all buffered rows to the answers table in one transaction."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending, self._size = self._pending, {}, 0
+                cutoff = monotonic() - self.idle_seconds
+                idle = {
+                    attempt_id for attempt_id, touched in self._touched.items()
+                    if touched < cutoff and attempt_id not in pending
+                }
+            if not pending and not idle:
+                return 0
+
+            if has_app_context():
+                return self._write(pending, idle)
+            with self.app.app_context():
+                return self._write(pending, idle)
+
+    def _write(self, pending, idle):
+        try:
+            # Deltas accepted on an exam-session token may race a submit; drop closed attempts here.
+            checked = set(pending) | idle
+            open_ids = in_progress_attempts(checked)
+            count = upsert_answers([
+                row for attempt_id, rows in pending.items() if attempt_id in open_ids
+                for row in rows.values()
+            ])
+            db.session.commit()
+            self.flushed += count
+        except Exception as e:
+            db.session.rollback()
+            self.flush_errors += 1
+            current_app.logger.error(f"Error flushing autosave buffer: {str(e)}")
+            with self._lock:
+                # Requeue, but never over a newer delta that arrived meanwhile.
+                for attempt_id, rows in pending.items():
+                    current = self._pending.setdefault(attempt_id, {})
+                    for question_id, row in rows.items():
+                        if question_id not in current:
+                            current[question_id] = row
+                            self._size += 1
+            return 0
+
+        with self._lock:
+            self._forget(checked - open_ids)
+            now = monotonic()
+            for attempt_id in idle & open_ids:
+                # Still running; look again after another idle period.
+                self._touched[attempt_id] = now
+        return count
+
+
+autosave_buffer = AutosaveBuffer()
@@ -11,12 +11,17 @@ class Config:
     DB_PASSWORD = os.getenv('DB_PASSWORD')
     SQLALCHEMY_DATABASE_URI = f"mssql+pyodbc://{DB_USERNAME}:{DB_PASSWORD}@{DB_SERVER}/{DB_NAME}?driver=ODBC+Driver+17+for+SQL+Server"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {'fast_executemany': True}
     
 
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-here')
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your-jwt-secret-key')
-    JWT_ACCESS_TOKEN_EXPIRES = int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES', 3600))
+    JWT_ACCESS_TOKEN_EXPIRES = int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES', 900))
+    JWT_REFRESH_TOKEN_EXPIRES = int(os.getenv('JWT_REFRESH_TOKEN_EXPIRES', 7 * 24 * 3600))
     BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+    PASSWORD_HASH_QUEUE_SIZE = int(os.getenv('PASSWORD_HASH_QUEUE_SIZE', 32))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 2.0))
     
 
     RATELIMIT_DEFAULT = "200 per day;50 per hour"
@@ -27,6 +32,61 @@ class Config:
     
  
     HEARTBEAT_INTERVAL = int(os.getenv('HEARTBEAT_INTERVAL', 300))
+    # Scheduler leader election; failover completes within TTL + RENEW seconds.
+    SCHEDULER_LEASE_NAME = os.getenv('SCHEDULER_LEASE_NAME', 'scheduler')
+    SCHEDULER_LEASE_TTL = int(os.getenv('SCHEDULER_LEASE_TTL', 30))
+    SCHEDULER_LEASE_RENEW = int(os.getenv('SCHEDULER_LEASE_RENEW', 10))
+    HEARTBEAT_BUFFER_SIZE = int(os.getenv('HEARTBEAT_BUFFER_SIZE', 1000))
+    CLIENT_PRESENCE_TTL = int(os.getenv('CLIENT_PRESENCE_TTL', 30))
+    CLIENT_PRESENCE_TICK = float(os.getenv('CLIENT_PRESENCE_TICK', 1.0))
+    CLIENT_PRESENCE_FLUSH_SECONDS = int(os.getenv('CLIENT_PRESENCE_FLUSH_SECONDS', 10))
 
     EXAM_AUTO_SUBMIT_BUFFER = int(os.getenv('EXAM_AUTO_SUBMIT_BUFFER', 30))
-    EXAM_ARCHIVE_DAYS = int(os.getenv('EXAM_ARCHIVE_DAYS', 30))
\ No newline at end of file
+    EXAM_SWEEP_SECONDS = int(os.getenv('EXAM_SWEEP_SECONDS', 5))
+    EXAM_SWEEP_BATCH_SIZE = int(os.getenv('EXAM_SWEEP_BATCH_SIZE', 200))
+    EXAM_SESSION_MAX_SECONDS = int(os.getenv('EXAM_SESSION_MAX_SECONDS', 12 * 3600))
+    EXAM_SESSION_REVOCATION_REFRESH = int(os.getenv('EXAM_SESSION_REVOCATION_REFRESH', 15))
+    EXAM_ARCHIVE_DAYS = int(os.getenv('EXAM_ARCHIVE_DAYS', 30))
+    ARCHIVE_CODEC = os.getenv('ARCHIVE_CODEC', 'gzip')
+    ARCHIVE_WORKERS = int(os.getenv('ARCHIVE_WORKERS', 4))
+    ARCHIVE_MAX_ATTEMPTS = int(os.getenv('ARCHIVE_MAX_ATTEMPTS', 3))
+    # Cold storage for archive payloads: 'local' or 'azure'
+    ARCHIVE_STORE = os.getenv('ARCHIVE_STORE', 'local')
+    ARCHIVE_STORE_PATH = os.getenv('ARCHIVE_STORE_PATH', 'archive_store')
+    ARCHIVE_TIER_DAYS = int(os.getenv('ARCHIVE_TIER_DAYS', 180))
+    ARCHIVE_TIER_BATCH = int(os.getenv('ARCHIVE_TIER_BATCH', 100))
+
+    AUDIT_QUEUE_SIZE = int(os.getenv('AUDIT_QUEUE_SIZE', 10000))
+    AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 500))
+    AUDIT_FLUSH_SECONDS = int(os.getenv('AUDIT_FLUSH_SECONDS', 2))
+
+    # Entity types (table names) skipped by change capture, and per-type sampling rates.
+    AUDIT_CHANGES_EXCLUDE = [t for t in os.getenv('AUDIT_CHANGES_EXCLUDE', '').split(',') if t]
+    AUDIT_CHANGES_SAMPLE_RATES = {
+        table: float(rate)
+        for table, rate in (
+            item.split(':') for item in os.getenv('AUDIT_CHANGES_SAMPLE_RATES', '').split(',') if item
+        )
+    }
+
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+    AUTHZ_CACHE_TTL = int(os.getenv('AUTHZ_CACHE_TTL', 60))
+    AUTHZ_CACHE_SIZE = int(os.getenv('AUTHZ_CACHE_SIZE', 10000))
+    EXAM_CACHE_SIZE = int(os.getenv('EXAM_CACHE_SIZE', 256))
+
+    AUTOSAVE_FLUSH_SECONDS = int(os.getenv('AUTOSAVE_FLUSH_SECONDS', 5))
+    AUTOSAVE_BUFFER_SIZE = int(os.getenv('AUTOSAVE_BUFFER_SIZE', 10000))
+    # Idle attempts are re-checked after this long and their sequence numbers dropped once closed
+    AUTOSAVE_IDLE_SECONDS = int(os.getenv('AUTOSAVE_IDLE_SECONDS', 300))
+
+    # Repeats of one statement shape in a single request before it is logged as a likely N+1
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', 10))
+    # X-SQL-* response headers; always on in debug mode
+    SQL_DEBUG_HEADERS = os.getenv('SQL_DEBUG_HEADERS', 'false').lower() == 'true'
+    # Bearer token required by /metrics when set
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+    GRADING_WORKERS = int(os.getenv('GRADING_WORKERS', 2))
+    GRADING_QUEUE_SIZE = int(os.getenv('GRADING_QUEUE_SIZE', 1000))
+    GRADING_MAX_RETRIES = int(os.getenv('GRADING_MAX_RETRIES', 3))
\ No newline at end of file
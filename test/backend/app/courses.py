@@ -1,6 +1,8 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
-from app.models import Course, CourseEnrollment, User, AuditLog
+from app.models import Course, CourseEnrollment, User
+from app.audit import audit
+from app.authz import authz
 from app import db
 from app import CourseForm, EnrollmentForm
 from datetime import datetime
@@ -52,20 +54,17 @@ def create_course():
             )
             db.session.add(enrollment)
             db.session.commit()
-            audit_log = AuditLog(
+            authz.invalidate(current_user.user_id)
+            audit.record(
                 user_id=current_user.user_id,
                 action='create_course',
                 entity_type='course',
                 entity_id=course.course_id,
-                new_values=str({
+                new_values={
                     'course_code': course.course_code,
                     'course_name': course.course_name
-                }),
-                ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent')
+                }
             )
-            db.session.add(audit_log)
-            db.session.commit()
             
             flash('Course created successfully!', 'success')
             return redirect(url_for('courses.list_courses'))
@@ -82,12 +81,7 @@ def enroll_student(course_id):
     course = Course.query.get_or_404(course_id)
     
     if current_user.role != 'admin':
-        enrollment = CourseEnrollment.query.filter_by(
-            course_id=course_id,
-            user_id=current_user.user_id,
-            role='professor'
-        ).first()
-        if not enrollment:
+        if not authz.is_professor(current_user.user_id, course_id):
             flash('You are not authorized to enroll students in this course.', 'danger')
             return redirect(url_for('courses.list_courses'))
     
@@ -113,22 +107,19 @@ def enroll_student(course_id):
                 )
                 db.session.add(enrollment)
                 db.session.commit()
+                authz.invalidate(form.user_id.data)
                 
-                audit_log = AuditLog(
+                audit.record(
                     user_id=current_user.user_id,
                     action='enroll_student',
                     entity_type='enrollment',
                     entity_id=enrollment.enrollment_id,
-                    new_values=str({
+                    new_values={
                         'course_id': course_id,
                         'user_id': form.user_id.data,
                         'role': 'student'
-                    }),
-                    ip_address=request.remote_addr,
-                    user_agent=request.headers.get('User-Agent')
+                    }
                 )
-                db.session.add(audit_log)
-                db.session.commit()
                 
                 flash('Student enrolled successfully!', 'success')
                 return redirect(url_for('courses.view_course', course_id=course_id))
@@ -146,11 +137,7 @@ def view_course(course_id):
     if current_user.role == 'admin':
         pass
     else:
-        enrollment = CourseEnrollment.query.filter_by(
-            course_id=course_id,
-            user_id=current_user.user_id
-        ).first()
-        if not enrollment:
+        if not authz.is_member(current_user.user_id, course_id):
             flash('You are not enrolled in this course.', 'danger')
             return redirect(url_for('courses.list_courses'))
     
@@ -159,12 +146,7 @@ def view_course(course_id):
     if current_user.role == 'admin':
         exams = course.exams
     elif current_user.role == 'professor':
-        professor_enrollment = CourseEnrollment.query.filter_by(
-            course_id=course_id,
-            user_id=current_user.user_id,
-            role='professor'
-        ).first()
-        if professor_enrollment:
+        if authz.is_professor(current_user.user_id, course_id):
             exams = course.exams
         else:
             exams = []
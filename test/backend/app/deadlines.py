@@ -0,0 +1,172 @@
+import heapq
+from datetime import datetime, timedelta
+from threading import Lock
+from time import perf_counter
+from sqlalchemy import and_
+from app.models import db, Exam, ExamAttempt
+from app.answers import chunked
+from app.audit import audit
+from app.exam_session import attempt_deadline
+
+
+class DeadlineSweeper:
+    """Min-heap of in-progress attempt deadlines that auto-submits expired attempts.
+
+    The heap is filled from the filtered in-progress index at startup and
+    topped up with attempts started since the last load, so a sweep never
+    scans exam_attempts. Attempts started in this process are pushed
+    directly while it holds the scheduler lease; followers keep nothing. Expired attempts are closed in batches with a conditional
+    UPDATE, so running the sweep in several workers is harmless.
+    """
+
+    def __init__(self, buffer_seconds=30, batch_size=200):
+        self.app = None
+        self.buffer = timedelta(seconds=buffer_seconds)
+        self.batch_size = batch_size
+        self._lock = Lock()
+        self._heap = []
+        self._scheduled = set()
+        self._loaded_until = None
+        self.swept = 0
+        self.last_sweep_seconds = None
+
+    def init_app(self, app):
+        self.app = app
+        self.buffer = timedelta(seconds=app.config.get('EXAM_AUTO_SUBMIT_BUFFER', 30))
+        self.batch_size = app.config.get('EXAM_SWEEP_BATCH_SIZE', self.batch_size)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def reset(self):
+        """Forget every tracked deadline; the next load() reads them all from the index again."""
+        with self._lock:
+            self._heap = []
+            self._scheduled = set()
+        self._loaded_until = None
+
+    def schedule(self, attempt_id, exam_id, deadline):
+        """Track an attempt; deadline is when it must be submitted, before the buffer."""
+        if deadline is None:
+            return
+        with self._lock:
+            if attempt_id in self._scheduled:
+                return
+            self._scheduled.add(attempt_id)
+            heapq.heappush(self._heap, (deadline + self.buffer, attempt_id, exam_id))
+
+    def load(self):
+        """Push in-progress attempts started since the last load (all of them on the first call)."""
+        now = datetime.utcnow()
+        query = db.session.query(
+            ExamAttempt.attempt_id,
+            ExamAttempt.exam_id,
+            ExamAttempt.start_time,
+            Exam.time_limit_minutes,
+            Exam.available_to
+        ).join(
+            Exam, Exam.exam_id == ExamAttempt.exam_id
+        ).filter(
+            ExamAttempt.status == 'in_progress'
+        )
+        if self._loaded_until is not None:
+            # Overlap a little so attempts committed late by other workers are not missed.
+            query = query.filter(ExamAttempt.start_time >= self._loaded_until - timedelta(minutes=1))
+
+        count = 0
+        for row in query:
+            # Each row carries the exam and attempt columns attempt_deadline() reads.
+            self.schedule(row.attempt_id, row.exam_id, attempt_deadline(row, row))
+            count += 1
+        self._loaded_until = now
+        return count
+
+    def _pop_expired(self, now):
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(expired) < self.batch_size:
+                _, attempt_id, exam_id = heapq.heappop(self._heap)
+                self._scheduled.discard(attempt_id)
+                expired.append((attempt_id, exam_id))
+        return expired
+
+    def _submit_batch(self, batch):
+        attempt_ids = [attempt_id for attempt_id, _ in batch]
+        submitted = []
+        now = datetime.utcnow()
+        for chunk in chunked(attempt_ids):
+            result = db.session.execute(
+                ExamAttempt.__table__.update().where(and_(
+                    ExamAttempt.attempt_id.in_(chunk),
+                    ExamAttempt.status == 'in_progress'
+                )).values(
+                    status='submitted',
+                    submission_time=now,
+                    is_auto_submitted=True
+                ).returning(ExamAttempt.attempt_id, ExamAttempt.exam_id, ExamAttempt.user_id)
+            )
+            submitted.extend(result.fetchall())
+
+        for attempt_id, _, user_id in submitted:
+            audit.record(
+                user_id=user_id,
+                action='auto_submit_exam',
+                entity_type='exam_attempt',
+                entity_id=attempt_id,
+                sync=True
+            )
+        db.session.commit()
+        return submitted
+
+    def sweep(self):
+        """Auto-submit every attempt whose deadline plus buffer has passed."""
+        from app.autosave import autosave_buffer
+        from app.grading_queue import grading_queue
+        started = perf_counter()
+        self.load()
+        if self._heap and self._heap[0][0] <= datetime.utcnow():
+            # Land buffered answers first; the buffer requeues them itself if the write fails.
+            autosave_buffer.flush()
+
+        total = 0
+        while True:
+            batch = self._pop_expired(datetime.utcnow())
+            if not batch:
+                break
+            try:
+                submitted = self._submit_batch(batch)
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"Error auto-submitting {len(batch)} attempts: {str(e)}")
+                with self._lock:
+                    for attempt_id, exam_id in batch:
+                        self._scheduled.discard(attempt_id)
+                # Forget the load watermark so the next sweep reloads them from the index.
+                self._loaded_until = None
+                break
+
+            for attempt_id, exam_id, _ in submitted:
+                if not grading_queue.enqueue(exam_id, attempt_id):
+                    self.app.logger.warning(
+                        f"Grading queue full; auto-submitted attempt {attempt_id} left for manual grading")
+            total += len(submitted)
+
+        self.swept += total
+        self.last_sweep_seconds = perf_counter() - started
+        if total:
+            self.app.logger.info(
+                f"Auto-submitted {total} expired attempts in {self.last_sweep_seconds:.2f}s "
+                f"({len(self._heap)} deadlines pending)"
+            )
+        return total
+
+    def stats(self):
+        return {
+            'pending': len(self._heap),
+            'next_deadline': self._heap[0][0].isoformat() if self._heap else None,
+            'swept': self.swept,
+            'last_sweep_seconds': self.last_sweep_seconds
+        }
+
+
+deadline_sweeper = DeadlineSweeper()
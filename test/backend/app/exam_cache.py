@@ -0,0 +1,200 @@
+from collections import namedtuple, OrderedDict
+from threading import Lock
+from sqlalchemy import and_, func
+from app.models import db, Exam, Question, QuestionOption
+
+
+PaperOption = namedtuple('PaperOption', [
+    'option_id', 'option_text', 'display_order'
+])
+
+PaperQuestion = namedtuple('PaperQuestion', [
+    'question_id', 'question_text', 'question_type', 'points',
+    'display_order', 'media_url', 'options'
+])
+
+ExamMeta = namedtuple('ExamMeta', [
+    'exam_id', 'course_id', 'exam_name', 'description', 'time_limit_minutes', 'available_to'
+])
+
+ExamPaper = namedtuple('ExamPaper', ['exam_id', 'version', 'exam', 'questions'])
+
+KeyEntry = namedtuple('KeyEntry', ['question_type', 'points', 'correct_option_ids'])
+
+AnswerKey = namedtuple('AnswerKey', ['exam_id', 'version', 'questions'])
+
+OBJECTIVE_TYPES = ['multiple_choice', 'true_false']
+
+
+class LRUCache:
+    """Small thread-safe LRU mapping."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+_papers = LRUCache()
+_answer_keys = LRUCache()
+
+
+def init_app(app):
+    """Size the exam caches from the app config."""
+    _papers.maxsize = app.config.get('EXAM_CACHE_SIZE', _papers.maxsize)
+    _answer_keys.maxsize = app.config.get('EXAM_CACHE_SIZE', _answer_keys.maxsize)
+
+
+def exam_version(exam_id):
+    """Return the exam's content version from the database (a primary-key lookup)."""
+    version = db.session.query(Exam.content_version).filter(Exam.exam_id == exam_id).scalar()
+    return version or 0
+
+
+def invalidate_exam(exam_id):
+    """Bump the exam's content version in the current transaction; does not commit.
+
+    The version lives in the exams row, so every worker rebuilds its cached
+    paper and answer key on the next read after the edit commits.
+    """
+    db.session.execute(
+        Exam.__table__.update().where(Exam.exam_id == exam_id).values(
+            content_version=func.coalesce(Exam.content_version, 0) + 1
+        )
+    )
+    _papers.pop(exam_id)
+    _answer_keys.pop(exam_id)
+
+
+def _cached(cache, exam_id, build):
+    version = exam_version(exam_id)
+    value = cache.get(exam_id)
+    if value is not None and value.version == version:
+        return value
+
+    # If the exam is edited while we build, the snapshot carries the old
+    # version and the next read replaces it.
+    value = build(exam_id, version)
+    cache.put(exam_id, value)
+    return value
+
+
+def build_exam_paper(exam_id, version=0):
+    """Build an immutable exam paper with a single questions/options join."""
+    meta = db.session.query(
+        Exam.exam_id, Exam.course_id, Exam.exam_name, Exam.description,
+        Exam.time_limit_minutes, Exam.available_to
+    ).filter(Exam.exam_id == exam_id).first()
+    rows = db.session.query(
+        Question.question_id,
+        Question.question_text,
+        Question.question_type,
+        Question.points,
+        Question.display_order,
+        Question.media_url,
+        QuestionOption.option_id,
+        QuestionOption.option_text,
+        QuestionOption.display_order
+    ).outerjoin(
+        QuestionOption, QuestionOption.question_id == Question.question_id
+    ).filter(
+        Question.exam_id == exam_id
+    ).order_by(
+        Question.display_order, Question.question_id, QuestionOption.display_order
+    ).all()
+
+    questions = []
+    current = None
+    options = []
+    for row in rows:
+        if current is None or current[0] != row[0]:
+            if current is not None:
+                questions.append(PaperQuestion(*current, options=tuple(options)))
+            current = row[:6]
+            options = []
+        if row[6] is not None and row[2] in OBJECTIVE_TYPES:
+            options.append(PaperOption(row[6], row[7], row[8]))
+    if current is not None:
+        questions.append(PaperQuestion(*current, options=tuple(options)))
+
+    return ExamPaper(
+        exam_id=exam_id,
+        version=version,
+        exam=ExamMeta(*meta) if meta else None,
+        questions=tuple(questions)
+    )
+
+
+def build_answer_key(exam_id, version=0):
+    """Build question_id -> (type, points, correct option ids) for an exam in one query."""
+    rows = db.session.query(
+        Question.question_id, Question.question_type, Question.points, QuestionOption.option_id
+    ).outerjoin(
+        QuestionOption,
+        and_(QuestionOption.question_id == Question.question_id, QuestionOption.is_correct == True)
+    ).filter(
+        Question.exam_id == exam_id
+    ).all()
+
+    correct = {}
+    details = {}
+    for question_id, question_type, points, option_id in rows:
+        details[question_id] = (question_type, points)
+        options = correct.setdefault(question_id, set())
+        if option_id is not None:
+            options.add(option_id)
+
+    questions = {
+        question_id: KeyEntry(question_type, points, frozenset(correct[question_id]))
+        for question_id, (question_type, points) in details.items()
+    }
+    return AnswerKey(exam_id=exam_id, version=version, questions=questions)
+
+
+def get_exam_paper(exam_id):
+    """Return the cached exam paper, building it if missing or stale."""
+    return _cached(_papers, exam_id, build_exam_paper)
+
+
+def get_answer_key(exam_id):
+    """Return the cached answer key, building it if missing or stale."""
+    return _cached(_answer_keys, exam_id, build_answer_key)
+
+
+def correct_option_ids(answer_key, question_id):
+    """Return the correct option ids for a question, empty if it is unknown or subjective."""
+    entry = answer_key.questions.get(question_id)
+    if not entry or entry.question_type not in OBJECTIVE_TYPES:
+        return frozenset()
+    return entry.correct_option_ids
+
+
+def is_correct_option(answer_key, question_id, option_id):
+    """True if option_id is a correct choice for an objective question."""
+    return option_id in correct_option_ids(answer_key, question_id)
@@ -0,0 +1,166 @@
+import calendar
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+from threading import Lock
+import jwt
+from flask import current_app, request, session
+from app.models import db, RevokedToken
+from app.utils import scheduler
+
+TOKEN_TYPE = 'exam_session'
+HEADER = 'X-Exam-Session'
+
+# The running attempt as described by a verified token, for views that skip the attempt lookup.
+SessionAttempt = namedtuple('SessionAttempt', ['attempt_id', 'exam_id', 'user_id', 'status', 'deadline'])
+
+
+class ExamSessionRevocations:
+    """In-memory set of revoked exam-session token ids.
+
+    Revocations made in this process apply immediately; the set is reloaded
+    from revoked_tokens periodically so other workers catch up within one
+    refresh interval.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._revoked = frozenset()
+        self._local = set()
+        self.refreshed_at = None
+
+    def __contains__(self, jti):
+        return jti in self._revoked or jti in self._local
+
+    def add(self, jti):
+        with self._lock:
+            self._local.add(jti)
+
+    def refresh(self):
+        rows = db.session.query(RevokedToken.jti).filter(
+            RevokedToken.token_type == TOKEN_TYPE,
+            RevokedToken.expires_at > datetime.utcnow()
+        )
+        revoked = frozenset(row.jti for row in rows)
+        with self._lock:
+            self._revoked = revoked
+            self._local -= revoked
+            self.refreshed_at = datetime.utcnow()
+        return len(revoked)
+
+
+revocations = ExamSessionRevocations()
+
+
+def attempt_deadline(exam, attempt):
+    """Return when the attempt must be submitted, or None if it is open-ended."""
+    if exam.time_limit_minutes:
+        return attempt.start_time + timedelta(minutes=exam.time_limit_minutes)
+    return exam.available_to
+
+
+def _decode(token):
+    try:
+        return jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return None
+
+
+def issue_exam_session(exam, attempt):
+    """Sign a token binding the caller to one running attempt."""
+    now = datetime.utcnow()
+    deadline = attempt_deadline(exam, attempt)
+    grace = timedelta(seconds=current_app.config.get('EXAM_AUTO_SUBMIT_BUFFER', 30))
+    expires = deadline + grace if deadline else now + timedelta(
+        seconds=current_app.config.get('EXAM_SESSION_MAX_SECONDS', 12 * 3600))
+    claims = {
+        'typ': TOKEN_TYPE,
+        'jti': uuid.uuid4().hex,
+        'sub': str(attempt.user_id),
+        'aid': attempt.attempt_id,
+        'eid': exam.exam_id,
+        'cid': exam.course_id,
+        'dl': calendar.timegm(deadline.utctimetuple()) if deadline else None,
+        'iat': now,
+        'exp': expires
+    }
+    if exam.ip_restriction:
+        claims['ip'] = request.remote_addr
+    token = jwt.encode(claims, current_app.config['SECRET_KEY'], algorithm='HS256')
+
+    # Browser flows carry the token in the signed session cookie; API clients get it back in the response.
+    tokens = {
+        key: value for key, value in session.get('exam_sessions', {}).items() if _decode(value)
+    }
+    tokens[str(attempt.attempt_id)] = token
+    session['exam_sessions'] = tokens
+    return token
+
+
+def _candidate_tokens():
+    token = request.headers.get(HEADER)
+    if token:
+        return [token]
+    return list(session.get('exam_sessions', {}).values())
+
+
+def verify_exam_session(user_id, exam_id=None, attempt_id=None):
+    """Return the claims of a valid exam-session token for this caller, or None.
+
+    None means "fall back to the database checks", never "deny". Tokens are
+    only honoured until the attempt deadline plus the submit buffer, the same
+    window the database path allows.
+    """
+    now = calendar.timegm(datetime.utcnow().utctimetuple())
+    buffer = current_app.config.get('EXAM_AUTO_SUBMIT_BUFFER', 30)
+    for token in _candidate_tokens():
+        claims = _decode(token)
+        if claims is None or claims.get('typ') != TOKEN_TYPE or claims['jti'] in revocations:
+            continue
+        if claims['sub'] != str(user_id):
+            continue
+        if exam_id is not None and claims['eid'] != exam_id:
+            continue
+        if attempt_id is not None and claims['aid'] != attempt_id:
+            continue
+        if claims.get('dl') is not None and now > claims['dl'] + buffer:
+            continue
+        if 'ip' in claims and claims['ip'] != request.remote_addr:
+            continue
+        return claims
+    return None
+
+
+def session_attempt(claims):
+    """Build a SessionAttempt from verified claims."""
+    return SessionAttempt(
+        attempt_id=claims['aid'],
+        exam_id=claims['eid'],
+        user_id=int(claims['sub']),
+        status='in_progress',
+        deadline=datetime.utcfromtimestamp(claims['dl']) if claims.get('dl') else None
+    )
+
+
+def revoke_exam_session(claims):
+    """Revoke a token server-side; does not commit."""
+    revocations.add(claims['jti'])
+    db.session.add(RevokedToken(
+        jti=claims['jti'],
+        token_type=TOKEN_TYPE,
+        user_id=int(claims['sub']),
+        expires_at=datetime.utcfromtimestamp(claims['exp'])
+    ))
+    tokens = dict(session.get('exam_sessions', {}))
+    if tokens.pop(str(claims['aid']), None) is not None:
+        session['exam_sessions'] = tokens
+
+
+def refresh_revocations():
+    """Reload revoked exam-session ids written by other workers."""
+    with scheduler.app.app_context():
+        try:
+            revocations.refresh()
+        except Exception as e:
+            db.session.rollback()
+            scheduler.app.logger.error(f"Error refreshing exam-session revocations: {str(e)}")
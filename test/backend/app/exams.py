@@ -1,11 +1,25 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, g
 from flask_login import login_required, current_user
-from app.models import Exam, Course, Question, QuestionOption, ExamAttempt, Answer, AuditLog
+from app.models import Exam, Course, Question, QuestionOption, ExamAttempt, Answer, ArchivedExam
 from app import db
 from app.forms import ExamForm, QuestionForm, OptionForm
 from datetime import datetime, timedelta
+from sqlalchemy import and_
 from sqlalchemy.exc import IntegrityError
 from app.utils import role_required, archive_exam
+from app.exam_cache import get_exam_paper, get_answer_key, correct_option_ids, invalidate_exam, OBJECTIVE_TYPES
+from app.answers import upsert_answers
+from app.audit import audit
+from app.authz import authz
+from app.api_auth import api_login_required
+from app.autosave import autosave_buffer
+from app.exam_session import (
+    issue_exam_session, verify_exam_session, revoke_exam_session, attempt_deadline, session_attempt
+)
+from app.deadlines import deadline_sweeper
+from app.leader import leader
+from app.grading_queue import grading_queue
+from app.archive import read_archived_attempt, read_archived_user_attempts
 import json
 
 exams = Blueprint('exams', __name__)
@@ -17,12 +31,7 @@ def create_exam(course_id):
     course = Course.query.get_or_404(course_id)
     
     if current_user.role != 'admin':
-        enrollment = CourseEnrollment.query.filter_by(
-            course_id=course_id,
-            user_id=current_user.user_id,
-            role='professor'
-        ).first()
-        if not enrollment:
+        if not authz.is_professor(current_user.user_id, course_id):
             flash('You are not authorized to create exams for this course.', 'danger')
             return redirect(url_for('courses.view_course', course_id=course_id))
     
@@ -47,20 +56,16 @@ def create_exam(course_id):
             db.session.add(exam)
             db.session.commit()
             
-            audit_log = AuditLog(
+            audit.record(
                 user_id=current_user.user_id,
                 action='create_exam',
                 entity_type='exam',
                 entity_id=exam.exam_id,
-                new_values=str({
+                new_values={
                     'course_id': course_id,
                     'exam_name': exam.exam_name
-                }),
-                ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent')
+                }
             )
-            db.session.add(audit_log)
-            db.session.commit()
             
             flash('Exam created successfully! Now add questions.', 'success')
             return redirect(url_for('exams.manage_questions', exam_id=exam.exam_id))
@@ -78,12 +83,7 @@ def manage_questions(exam_id):
     
 
     if current_user.role != 'admin':
-        enrollment = CourseEnrollment.query.filter_by(
-            course_id=exam.course_id,
-            user_id=current_user.user_id,
-            role='professor'
-        ).first()
-        if not enrollment:
+        if not authz.is_professor(current_user.user_id, exam.course_id):
             flash('You are not authorized to manage this exam.', 'danger')
             return redirect(url_for('courses.view_course', course_id=exam.course_id))
     
@@ -102,23 +102,20 @@ def manage_questions(exam_id):
                 media_url=question_form.media_url.data
             )
             db.session.add(question)
+            invalidate_exam(exam_id)
             db.session.commit()
             
-            audit_log = AuditLog(
+            audit.record(
                 user_id=current_user.user_id,
                 action='add_question',
                 entity_type='question',
                 entity_id=question.question_id,
-                new_values=str({
+                new_values={
                     'exam_id': exam_id,
                     'question_text': question.question_text[:50] + '...' if len(question.question_text) > 50 else question.question_text,
                     'question_type': question.question_type
-                }),
-                ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent')
+                }
             )
-            db.session.add(audit_log)
-            db.session.commit()
             
             flash('Question added successfully!', 'success')
             return redirect(url_for('exams.manage_questions', exam_id=exam_id))
@@ -139,12 +136,7 @@ def manage_options(question_id):
     exam = question.exam
 
     if current_user.role != 'admin':
-        enrollment = CourseEnrollment.query.filter_by(
-            course_id=exam.course_id,
-            user_id=current_user.user_id,
-            role='professor'
-        ).first()
-        if not enrollment:
+        if not authz.is_professor(current_user.user_id, exam.course_id):
             flash('You are not authorized to manage this question.', 'danger')
             return redirect(url_for('courses.view_course', course_id=exam.course_id))
     
@@ -161,23 +153,20 @@ def manage_options(question_id):
                 display_order=option_form.display_order.data
             )
             db.session.add(option)
+            invalidate_exam(exam.exam_id)
             db.session.commit()
 
-            audit_log = AuditLog(
+            audit.record(
                 user_id=current_user.user_id,
                 action='add_option',
                 entity_type='option',
                 entity_id=option.option_id,
-                new_values=str({
+                new_values={
                     'question_id': question_id,
                     'option_text': option.option_text[:50] + '...' if len(option.option_text) > 50 else option.option_text,
                     'is_correct': option.is_correct
-                }),
-                ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent')
+                }
             )
-            db.session.add(audit_log)
-            db.session.commit()
             
             flash('Option added successfully!', 'success')
             return redirect(url_for('exams.manage_options', question_id=question_id))
@@ -191,163 +180,374 @@ def manage_options(question_id):
                          options=options, 
                          option_form=option_form)
 
-@exams.route('/exams/<int:exam_id>/take', methods=['GET', 'POST'])
-@login_required
-@role_required(['student'])
-def take_exam(exam_id):
-    exam = Exam.query.get_or_404(exam_id)
-
-    enrollment = CourseEnrollment.query.filter_by(
-        course_id=exam.course_id,
-        user_id=current_user.user_id
-    ).first()
-    if not enrollment:
-        flash('You are not enrolled in this course.', 'danger')
-        return redirect(url_for('courses.list_courses'))
-  
+def _availability_error(exam):
+    """Return why the exam cannot be taken right now, or None."""
     if not exam.is_published:
-        flash('This exam is not yet published.', 'danger')
-        return redirect(url_for('courses.view_course', course_id=exam.course_id))
+        return 'This exam is not yet published.'
     
     now = datetime.utcnow()
     if exam.available_from and now < exam.available_from:
-        flash('This exam is not yet available.', 'danger')
-        return redirect(url_for('courses.view_course', course_id=exam.course_id))
+        return 'This exam is not yet available.'
     
     if exam.available_to and now > exam.available_to:
-        flash('This exam is no longer available.', 'danger')
-        return redirect(url_for('courses.view_course', course_id=exam.course_id))
+        return 'This exam is no longer available.'
     
 
     if exam.ip_restriction and request.remote_addr not in exam.ip_restriction.split(','):
-        flash('You cannot take this exam from your current location.', 'danger')
-        return redirect(url_for('courses.view_course', course_id=exam.course_id))
-    
+        return 'You cannot take this exam from your current location.'
+    return None
 
+def _remaining_seconds(exam, attempt):
+    if not exam.time_limit_minutes:
+        return None
+    time_elapsed = datetime.utcnow() - attempt.start_time
+    return max(0, exam.time_limit_minutes * 60 - time_elapsed.total_seconds())
+
+def _open_attempt(exam, user_id):
+    """Return (attempt, expired): the user's running attempt, or a new one."""
     attempt = ExamAttempt.query.filter_by(
-        exam_id=exam_id,
-        user_id=current_user.user_id
+        exam_id=exam.exam_id,
+        user_id=user_id
     ).order_by(ExamAttempt.start_time.desc()).first()
     
     if not attempt or attempt.status == 'submitted' or attempt.status == 'graded':
 
         attempt = ExamAttempt(
-            exam_id=exam_id,
-            user_id=current_user.user_id,
+            exam_id=exam.exam_id,
+            user_id=user_id,
             start_time=datetime.utcnow(),
             ip_address=request.remote_addr,
             status='in_progress'
         )
         db.session.add(attempt)
         db.session.commit()
+        if leader.is_leader():
+            # Followers never sweep; the leader's next load() picks this attempt up either way.
+            deadline_sweeper.schedule(attempt.attempt_id, exam.exam_id, attempt_deadline(exam, attempt))
         
 
-        audit_log = AuditLog(
-            user_id=current_user.user_id,
+        audit.record(
+            user_id=user_id,
             action='start_exam',
             entity_type='exam_attempt',
-            entity_id=attempt.attempt_id,
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent')
+            entity_id=attempt.attempt_id
         )
-        db.session.add(audit_log)
-        db.session.commit()
     elif attempt.status == 'in_progress':
 
-        if exam.time_limit_minutes:
-            time_elapsed = datetime.utcnow() - attempt.start_time
-            if time_elapsed.total_seconds() > exam.time_limit_minutes * 60:
-                attempt.status = 'submitted'
-                attempt.submission_time = datetime.utcnow()
-                attempt.is_auto_submitted = True
-                db.session.commit()
-                
-                flash('Your time has expired and the exam was automatically submitted.', 'info')
-                return redirect(url_for('exams.view_results', attempt_id=attempt.attempt_id))
+        if _remaining_seconds(exam, attempt) == 0:
+            attempt.status = 'submitted'
+            attempt.submission_time = datetime.utcnow()
+            attempt.is_auto_submitted = True
+            db.session.commit()
+            return attempt, True
+    return attempt, False
 
-    questions = Question.query.filter_by(exam_id=exam_id).order_by(Question.display_order).all()
-    for question in questions:
-        if question.question_type in ['multiple_choice', 'true_false']:
-            question.options = QuestionOption.query.filter_by(
-                question_id=question.question_id
-            ).order_by(QuestionOption.display_order).all()
-        question.existing_answer = Answer.query.filter_by(
-            attempt_id=attempt.attempt_id,
-            question_id=question.question_id
-        ).first()
-    remaining_time = None
-    if exam.time_limit_minutes:
-        time_elapsed = datetime.utcnow() - attempt.start_time
-        remaining_seconds = exam.time_limit_minutes * 60 - time_elapsed.total_seconds()
-        remaining_time = max(0, remaining_seconds)
+def _answer_values(question, value):
+    """Map a submitted value onto answer columns; raises ValueError for a bad option id."""
+    if question.question_type in OBJECTIVE_TYPES:
+        return {'selected_option_id': int(value) if value else None}
+    return {'answer_text': value}
+
+def _submit_attempt(attempt_id, exam_id, user_id, rows, claims=None):
+    """Save the final answers and mark the attempt submitted in one transaction, then queue grading.
+
+    The status flip is a conditional UPDATE on (attempt, owner, in_progress),
+    so no attempt row needs to be loaded first and a double submit is a no-op.
+    Returns False if the attempt was no longer in progress.
+    """
+    # Autosaved deltas go first so the submitted answers win for the same question.
+    rows = autosave_buffer.drain(attempt_id) + rows
+    try:
+        upsert_answers(rows)
+
+        result = db.session.execute(
+            ExamAttempt.__table__.update().where(and_(
+                ExamAttempt.attempt_id == attempt_id,
+                ExamAttempt.user_id == user_id,
+                ExamAttempt.status == 'in_progress'
+            )).values(status='submitted', submission_time=datetime.utcnow())
+        )
+        if result.rowcount != 1:
+            db.session.rollback()
+            return False
+
+        audit.record(
+            user_id=user_id,
+            action='submit_exam',
+            entity_type='exam_attempt',
+            entity_id=attempt_id,
+            sync=True
+        )
+        if claims:
+            revoke_exam_session(claims)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if not grading_queue.enqueue(exam_id, attempt_id):
+        current_app.logger.warning(f"Grading queue full; attempt {attempt_id} left for manual grading")
+    return True
+
+@exams.route('/exams/<int:exam_id>/take', methods=['GET', 'POST'])
+@login_required
+@role_required(['student'])
+def take_exam(exam_id):
+    # A valid exam-session token already proves enrollment, availability and IP for this attempt,
+    # and carries its deadline, so the page renders from the cached paper without the exam and
+    # attempt lookups. A submit revokes the token, so a closed attempt falls through below.
+    claims = verify_exam_session(current_user.user_id, exam_id=exam_id)
+    if claims:
+        paper = get_exam_paper(exam_id)
+        attempt = session_attempt(claims)
+        now = datetime.utcnow()
+        if paper.exam is not None and (attempt.deadline is None or attempt.deadline > now):
+            remaining = None
+            if paper.exam.time_limit_minutes:
+                remaining = (attempt.deadline - now).total_seconds()
+            return _render_attempt(paper.exam, attempt, paper, remaining)
+
+    exam = Exam.query.get_or_404(exam_id)
+    if not authz.is_member(current_user.user_id, exam.course_id):
+        flash('You are not enrolled in this course.', 'danger')
+        return redirect(url_for('courses.list_courses'))
+
+    error = _availability_error(exam)
+    if error:
+        flash(error, 'danger')
+        return redirect(url_for('courses.view_course', course_id=exam.course_id))
+
+    attempt, expired = _open_attempt(exam, current_user.user_id)
+    if expired:
+        flash('Your time has expired and the exam was automatically submitted.', 'info')
+        return redirect(url_for('exams.view_results', attempt_id=attempt.attempt_id))
+    issue_exam_session(exam, attempt)
+
+    return _render_attempt(exam, attempt, get_exam_paper(exam_id), _remaining_seconds(exam, attempt))
+
+def _render_attempt(exam, attempt, paper, remaining_time):
+    answers = {
+        answer.question_id: answer
+        for answer in Answer.query.filter_by(attempt_id=attempt.attempt_id).all()
+    }
     
     return render_template('exams/take.html', 
                          exam=exam, 
                          attempt=attempt,
-                         questions=questions,
+                         questions=paper.questions,
+                         answers=answers,
                          remaining_time=remaining_time)
 
 @exams.route('/attempts/<int:attempt_id>/submit', methods=['POST'])
 @login_required
 def submit_exam(attempt_id):
-    attempt = ExamAttempt.query.get_or_404(attempt_id)
-    
-    if attempt.user_id != current_user.user_id:
-        flash('You are not authorized to submit this attempt.', 'danger')
-        return redirect(url_for('courses.list_courses'))
+    claims = verify_exam_session(current_user.user_id, attempt_id=attempt_id)
+    if claims:
+        exam_id = claims['eid']
+    else:
+        attempt = ExamAttempt.query.get_or_404(attempt_id)
+        
+        if attempt.user_id != current_user.user_id:
+            flash('You are not authorized to submit this attempt.', 'danger')
+            return redirect(url_for('courses.list_courses'))
 
-    if attempt.status != 'in_progress':
-        flash('This attempt has already been submitted.', 'info')
-        return redirect(url_for('exams.view_results', attempt_id=attempt_id))
+        if attempt.status != 'in_progress':
+            flash('This attempt has already been submitted.', 'info')
+            return redirect(url_for('exams.view_results', attempt_id=attempt_id))
+        exam_id = attempt.exam_id
 
-    exam = attempt.exam
-    questions = exam.questions
-    
-    for question in questions:
+    rows = []
+    for question in get_exam_paper(exam_id).questions:
         answer_key = f'question_{question.question_id}'
-        
+
         if answer_key in request.form or answer_key in request.files:
-            existing_answer = Answer.query.filter_by(
-                attempt_id=attempt.attempt_id,
-                question_id=question.question_id
-            ).first()
-            
-            if not existing_answer:
-                existing_answer = Answer(
-                    attempt_id=attempt.attempt_id,
-                    question_id=question.question_id
-                )
-                db.session.add(existing_answer)
-
-            if question.question_type in ['multiple_choice', 'true_false']:
-                selected_option_id = request.form.get(answer_key)
-                if selected_option_id:
-                    existing_answer.selected_option_id = int(selected_option_id)
-            else:
-                answer_text = request.form.get(answer_key)
-                if answer_text:
-                    existing_answer.answer_text = answer_text
-            
-            db.session.commit()
+            row = {
+                'attempt_id': attempt_id,
+                'question_id': question.question_id
+            }
+            value = request.form.get(answer_key)
+            if value:
+                row.update(_answer_values(question, value))
+            rows.append(row)
 
-    attempt.status = 'submitted'
-    attempt.submission_time = datetime.utcnow()
-    db.session.commit()
-    
-    audit_log = AuditLog(
-        user_id=current_user.user_id,
-        action='submit_exam',
-        entity_type='exam_attempt',
-        entity_id=attempt.attempt_id,
-        ip_address=request.remote_addr,
-        user_agent=request.headers.get('User-Agent')
-    )
-    db.session.add(audit_log)
-    db.session.commit()
+    try:
+        submitted = _submit_attempt(attempt_id, exam_id, current_user.user_id, rows, claims)
+    except Exception as e:
+        flash('An error occurred while submitting the exam.', 'danger')
+        return redirect(url_for('exams.take_exam', exam_id=exam_id))
+
+    if not submitted:
+        flash('This attempt has already been submitted.', 'info')
+        return redirect(url_for('exams.view_results', attempt_id=attempt_id))
     
     flash('Exam submitted successfully!', 'success')
     return redirect(url_for('exams.view_results', attempt_id=attempt_id))
 
+def _parse_answer_deltas(questions, deltas, require_seq=True):
+    """Validate JSON answer deltas; returns (parsed, error) with parsed as (question_id, seq, values)."""
+    if not isinstance(deltas, list):
+        return None, 'Expected a list of answers.'
+    parsed = []
+    for delta in deltas:
+        try:
+            question_id = int(delta['question_id'])
+            seq = int(delta['seq']) if require_seq else None
+        except (KeyError, TypeError, ValueError):
+            return None, 'Each answer needs a question_id and seq.' if require_seq else 'Each answer needs a question_id.'
+
+        question = questions.get(question_id)
+        if question is None:
+            return None, f'Question {question_id} is not part of this exam.'
+
+        value = delta.get('selected_option_id') if question.question_type in OBJECTIVE_TYPES else delta.get('answer_text')
+        try:
+            values = _answer_values(question, value)
+        except (TypeError, ValueError):
+            return None, 'selected_option_id must be an integer.'
+        parsed.append((question_id, seq, values))
+    return parsed, None
+
+@exams.route('/api/exams/<int:exam_id>/attempts', methods=['POST'])
+@api_login_required(['student'])
+def start_attempt_api(exam_id):
+    principal = g.principal
+    exam = Exam.query.get_or_404(exam_id)
+
+    if not principal.in_course(exam.course_id):
+        return jsonify({'error': 'You are not enrolled in this course.'}), 403
+
+    error = _availability_error(exam)
+    if error:
+        return jsonify({'error': error}), 403
+
+    attempt, expired = _open_attempt(exam, principal.user_id)
+    if expired:
+        return jsonify({
+            'error': 'Your time has expired and the exam was automatically submitted.',
+            'attempt_id': attempt.attempt_id
+        }), 409
+
+    answers = Answer.query.filter_by(attempt_id=attempt.attempt_id).all()
+    return jsonify({
+        'attempt_id': attempt.attempt_id,
+        'exam_id': exam_id,
+        'session_token': issue_exam_session(exam, attempt),
+        'remaining_seconds': _remaining_seconds(exam, attempt),
+        'questions': [
+            {
+                'question_id': question.question_id,
+                'question_text': question.question_text,
+                'question_type': question.question_type,
+                'points': float(question.points) if question.points is not None else None,
+                'media_url': question.media_url,
+                'options': [
+                    {'option_id': option.option_id, 'option_text': option.option_text}
+                    for option in question.options
+                ]
+            }
+            for question in get_exam_paper(exam_id).questions
+        ],
+        'answers': [
+            {
+                'question_id': answer.question_id,
+                'answer_text': answer.answer_text,
+                'selected_option_id': answer.selected_option_id
+            }
+            for answer in answers
+        ]
+    }), 201
+
+@exams.route('/api/attempts/<int:attempt_id>/submit', methods=['POST'])
+@api_login_required(['student'])
+def submit_attempt_api(attempt_id):
+    principal = g.principal
+    claims = verify_exam_session(principal.user_id, attempt_id=attempt_id)
+    if claims:
+        exam_id = claims['eid']
+    else:
+        attempt = ExamAttempt.query.get_or_404(attempt_id)
+
+        if attempt.user_id != principal.user_id:
+            return jsonify({'error': 'You are not authorized to submit this attempt.'}), 403
+
+        if attempt.status != 'in_progress':
+            return jsonify({'error': 'This attempt has already been submitted.'}), 409
+        exam_id = attempt.exam_id
+
+    questions = {
+        question.question_id: question
+        for question in get_exam_paper(exam_id).questions
+    }
+    parsed, error = _parse_answer_deltas(questions, (request.get_json(silent=True) or {}).get('answers', []), require_seq=False)
+    if error:
+        return jsonify({'error': error}), 400
+
+    rows = [
+        dict(values, attempt_id=attempt_id, question_id=question_id)
+        for question_id, _, values in parsed
+    ]
+    try:
+        submitted = _submit_attempt(attempt_id, exam_id, principal.user_id, rows, claims)
+    except Exception as e:
+        current_app.logger.error(f"Error submitting attempt {attempt_id}: {str(e)}")
+        return jsonify({'error': 'An error occurred while submitting the exam.'}), 500
+
+    if not submitted:
+        return jsonify({'error': 'This attempt has already been submitted.'}), 409
+
+    return jsonify({
+        'attempt_id': attempt_id,
+        'status': 'submitted',
+        'timestamp': datetime.utcnow().isoformat()
+    })
+
+@exams.route('/api/attempts/<int:attempt_id>/autosave', methods=['POST'])
+@api_login_required()
+def autosave_answers(attempt_id):
+    claims = verify_exam_session(g.principal.user_id, attempt_id=attempt_id)
+    if claims:
+        exam_id = claims['eid']
+        paper = get_exam_paper(exam_id)
+        deadline = session_attempt(claims).deadline
+    else:
+        attempt = ExamAttempt.query.get_or_404(attempt_id)
+
+        if attempt.user_id != g.principal.user_id:
+            return jsonify({'error': 'You are not authorized to update this attempt.'}), 403
+
+        if attempt.status != 'in_progress':
+            return jsonify({'error': 'This attempt has already been submitted.'}), 409
+        exam_id = attempt.exam_id
+        paper = get_exam_paper(exam_id)
+        deadline = attempt_deadline(paper.exam, attempt) if paper.exam else None
+
+    questions = {
+        question.question_id: question
+        for question in paper.questions
+    }
+    parsed, error = _parse_answer_deltas(questions, (request.get_json(silent=True) or {}).get('answers'))
+    if error:
+        return jsonify({'error': error}), 400
+
+    accepted = []
+    stale = []
+    for question_id, seq, values in parsed:
+        if autosave_buffer.add(attempt_id, question_id, seq, values):
+            accepted.append(question_id)
+        else:
+            stale.append(question_id)
+
+    if accepted and deadline and datetime.utcnow() >= deadline:
+        # In the grace window the sweeper may auto-submit at any moment, possibly in another
+        # worker; write through so these answers land before it instead of being dropped.
+        autosave_buffer.flush_attempt(attempt_id)
+
+    return jsonify({
+        'accepted': accepted,
+        'stale': stale,
+        'timestamp': datetime.utcnow().isoformat()
+    })
+
 @exams.route('/attempts/<int:attempt_id>/results')
 @login_required
 def view_results(attempt_id):
@@ -362,12 +562,7 @@ def view_results(attempt_id):
 
     if current_user.role in ['admin', 'professor'] and attempt.user_id != current_user.user_id:
         if current_user.role == 'professor':
-            enrollment = CourseEnrollment.query.filter_by(
-                course_id=exam.course_id,
-                user_id=current_user.user_id,
-                role='professor'
-            ).first()
-            if not enrollment:
+            if not authz.is_professor(current_user.user_id, exam.course_id):
                 flash('You are not authorized to view these results.', 'danger')
                 return redirect(url_for('courses.list_courses'))
     
@@ -389,26 +584,25 @@ def view_results(attempt_id):
         return redirect(url_for('courses.view_course', course_id=exam.course_id))
     
 
+    answer_key = get_answer_key(exam.exam_id)
+    answers = {
+        answer.question_id: answer
+        for answer in Answer.query.filter_by(attempt_id=attempt.attempt_id).all()
+    }
+
     questions = []
-    for question in exam.questions:
-        answer = Answer.query.filter_by(
-            attempt_id=attempt.attempt_id,
-            question_id=question.question_id
-        ).first()
-        
-        if question.question_type in ['multiple_choice', 'true_false']:
-            options = QuestionOption.query.filter_by(
-                question_id=question.question_id
-            ).order_by(QuestionOption.display_order).all()
-            
-            correct_options = [opt for opt in options if opt.is_correct]
+    for question in get_exam_paper(exam.exam_id).questions:
+        if question.question_type in OBJECTIVE_TYPES:
+            options = question.options
+            correct_ids = correct_option_ids(answer_key, question.question_id)
+            correct_options = [opt for opt in options if opt.option_id in correct_ids]
         else:
             options = None
             correct_options = None
         
         questions.append({
             'question': question,
-            'answer': answer,
+            'answer': answers.get(question.question_id),
             'options': options,
             'correct_options': correct_options
         })
@@ -427,12 +621,7 @@ def archive_exam(exam_id):
     
 
     if current_user.role != 'admin':
-        enrollment = CourseEnrollment.query.filter_by(
-            course_id=exam.course_id,
-            user_id=current_user.user_id,
-            role='professor'
-        ).first()
-        if not enrollment:
+        if not authz.is_professor(current_user.user_id, exam.course_id):
             flash('You are not authorized to archive this exam.', 'danger')
             return redirect(url_for('courses.view_course', course_id=exam.course_id))
     
@@ -444,4 +633,48 @@ def archive_exam(exam_id):
     else:
         flash(f'Error archiving exam: {message}', 'danger')
     
-    return redirect(url_for('courses.view_course', course_id=exam.course_id))
\ No newline at end of file
+    return redirect(url_for('courses.view_course', course_id=exam.course_id))
+
+def _archive_access_denied(archive):
+    if current_user.role == 'admin':
+        return False
+    if current_user.role != 'professor':
+        return True
+    return not authz.is_professor(current_user.user_id, archive.course_id)
+
+@exams.route('/api/archives/<int:archive_id>/attempts/<int:attempt_id>')
+@login_required
+def archived_attempt(archive_id, attempt_id):
+    # Missing archives, missing attempts and other users' attempts all get the same 404,
+    # so callers without course access cannot probe which attempt ids were archived.
+    not_found = jsonify({'error': 'Attempt not found in this archive.'}), 404
+    archive = ArchivedExam.query.with_entities(
+        ArchivedExam.archive_id, ArchivedExam.course_id
+    ).filter(ArchivedExam.archive_id == archive_id).first()
+    if archive is None:
+        return not_found
+
+    record = read_archived_attempt(archive_id, attempt_id)
+    if record is None:
+        return not_found
+
+    if record.get('user_id') != current_user.user_id and _archive_access_denied(archive):
+        return not_found
+
+    return jsonify(record)
+
+@exams.route('/api/archives/<int:archive_id>/users/<int:user_id>')
+@login_required
+def archived_user_attempts(archive_id, user_id):
+    archive = ArchivedExam.query.with_entities(
+        ArchivedExam.archive_id, ArchivedExam.course_id
+    ).filter(ArchivedExam.archive_id == archive_id).first_or_404()
+
+    if user_id != current_user.user_id and _archive_access_denied(archive):
+        return jsonify({'error': 'You are not authorized to view these attempts.'}), 403
+
+    return jsonify({
+        'archive_id': archive_id,
+        'user_id': user_id,
+        'attempts': read_archived_user_attempts(archive_id, user_id)
+    })
@@ -1,11 +1,15 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
-from app.models import Exam, ExamAttempt, Answer, Question, QuestionOption, AuditLog
+from app.models import Exam, ExamAttempt, Answer, Question
 from app import db
 from app.forms import GradingForm
 from datetime import datetime
 from sqlalchemy.exc import IntegrityError
 from app.utils import role_required
+from app.scoring import grade_exam
+from app.audit import audit
+from app.authz import authz
+from app.exam_cache import get_exam_paper, get_answer_key, correct_option_ids, is_correct_option, OBJECTIVE_TYPES
 
 grading = Blueprint('grading', __name__)
 
@@ -17,12 +21,7 @@ def list_attempts(exam_id):
     
 
     if current_user.role != 'admin':
-        enrollment = CourseEnrollment.query.filter_by(
-            course_id=exam.course_id,
-            user_id=current_user.user_id,
-            role='professor'
-        ).first()
-        if not enrollment:
+        if not authz.is_professor(current_user.user_id, exam.course_id):
             flash('You are not authorized to grade exams for this course.', 'danger')
             return redirect(url_for('courses.list_courses'))
 
@@ -39,12 +38,7 @@ def grade_attempt(attempt_id):
     
 
     if current_user.role != 'admin':
-        enrollment = CourseEnrollment.query.filter_by(
-            course_id=exam.course_id,
-            user_id=current_user.user_id,
-            role='professor'
-        ).first()
-        if not enrollment:
+        if not authz.is_professor(current_user.user_id, exam.course_id):
             flash('You are not authorized to grade this attempt.', 'danger')
             return redirect(url_for('courses.list_courses'))
     
@@ -54,24 +48,26 @@ def grade_attempt(attempt_id):
         return redirect(url_for('grading.list_attempts', exam_id=exam.exam_id))
     
 
+    answer_key = get_answer_key(exam.exam_id)
+    answers = {
+        answer.question_id: answer
+        for answer in Answer.query.filter_by(attempt_id=attempt.attempt_id).all()
+    }
+
     questions = []
-    for question in exam.questions:
-        answer = Answer.query.filter_by(
-            attempt_id=attempt.attempt_id,
-            question_id=question.question_id
-        ).first()
-        
-        if question.question_type in ['multiple_choice', 'true_false']:
-            options = QuestionOption.query.filter_by(
-                question_id=question.question_id
-            ).order_by(QuestionOption.display_order).all()
+    for question in get_exam_paper(exam.exam_id).questions:
+        if question.question_type in OBJECTIVE_TYPES:
+            options = question.options
+            correct_ids = correct_option_ids(answer_key, question.question_id)
         else:
             options = None
-        
+            correct_ids = None
+
         questions.append({
             'question': question,
-            'answer': answer,
-            'options': options
+            'answer': answers.get(question.question_id),
+            'options': options,
+            'correct_option_ids': correct_ids
         })
     
     if request.method == 'POST':
@@ -80,6 +76,8 @@ def grade_attempt(attempt_id):
             
             for question in questions:
                 answer = question['answer']
+                if answer is None:
+                    continue
                 points_key = f'points_{answer.answer_id}'
                 feedback_key = f'feedback_{answer.answer_id}'
                 
@@ -100,21 +98,18 @@ def grade_attempt(attempt_id):
             
             attempt.status = 'graded'
             attempt.total_score = total_score
-            db.session.commit()
             
-            audit_log = AuditLog(
+            audit.record(
                 user_id=current_user.user_id,
                 action='grade_exam',
                 entity_type='exam_attempt',
                 entity_id=attempt.attempt_id,
-                new_values=str({
+                new_values={
                     'total_score': total_score,
                     'status': 'graded'
-                }),
-                ip_address=request.remote_addr,
-                user_agent=request.headers.get('User-Agent')
+                },
+                sync=True
             )
-            db.session.add(audit_log)
             db.session.commit()
             
             flash('Exam graded successfully!', 'success')
@@ -136,12 +131,7 @@ def auto_grade_attempt(attempt_id):
     exam = attempt.exam
     
     if current_user.role != 'admin':
-        enrollment = CourseEnrollment.query.filter_by(
-            course_id=exam.course_id,
-            user_id=current_user.user_id,
-            role='professor'
-        ).first()
-        if not enrollment:
+        if not authz.is_professor(current_user.user_id, exam.course_id):
             flash('You are not authorized to grade this attempt.', 'danger')
             return redirect(url_for('courses.list_courses'))
     
@@ -151,49 +141,37 @@ def auto_grade_attempt(attempt_id):
     
     try:
         total_score = 0
-        
+        answer_key = get_answer_key(exam.exam_id)
+        graded_at = datetime.utcnow()
 
-        for question in exam.questions:
-            answer = Answer.query.filter_by(
-                attempt_id=attempt.attempt_id,
-                question_id=question.question_id
-            ).first()
-            
-            if not answer:
+        for answer in Answer.query.filter_by(attempt_id=attempt.attempt_id).all():
+            entry = answer_key.questions.get(answer.question_id)
+            if not entry or entry.question_type not in OBJECTIVE_TYPES:
                 continue
-            
 
-            if question.question_type in ['multiple_choice', 'true_false']:
-                if answer.selected_option_id:
-                    selected_option = QuestionOption.query.get(answer.selected_option_id)
-                    if selected_option and selected_option.is_correct:
-                        answer.points_awarded = question.points
-                    else:
-                        answer.points_awarded = 0
-                else:
-                    answer.points_awarded = 0
-                
-                answer.graded_by = current_user.user_id
-                answer.graded_at = datetime.utcnow()
-                total_score += answer.points_awarded
+            if is_correct_option(answer_key, answer.question_id, answer.selected_option_id):
+                answer.points_awarded = entry.points
+            else:
+                answer.points_awarded = 0
+
+            answer.graded_by = current_user.user_id
+            answer.graded_at = graded_at
+            total_score += answer.points_awarded
 
         attempt.status = 'graded'
         attempt.total_score = total_score
-        db.session.commit()
 
-        audit_log = AuditLog(
+        audit.record(
             user_id=current_user.user_id,
             action='auto_grade_exam',
             entity_type='exam_attempt',
             entity_id=attempt.attempt_id,
-            new_values=str({
+            new_values={
                 'total_score': total_score,
                 'status': 'graded'
-            }),
-            ip_address=request.remote_addr,
-            user_agent=request.headers.get('User-Agent')
+            },
+            sync=True
         )
-        db.session.add(audit_log)
         db.session.commit()
         
         flash('Auto-grading completed successfully!', 'success')
@@ -201,4 +179,43 @@ def auto_grade_attempt(attempt_id):
         db.session.rollback()
         flash(f'An error occurred during auto-grading: {str(e)}', 'danger')
     
-    return redirect(url_for('grading.list_attempts', exam_id=exam.exam_id))
\ No newline at end of file
+    return redirect(url_for('grading.list_attempts', exam_id=exam.exam_id))
+
+@grading.route('/exams/<int:exam_id>/auto-grade', methods=['POST'])
+@login_required
+@role_required(['admin', 'professor'])
+def auto_grade_exam(exam_id):
+    exam = Exam.query.get_or_404(exam_id)
+
+    if current_user.role != 'admin':
+        if not authz.is_professor(current_user.user_id, exam.course_id):
+            flash('You are not authorized to grade exams for this course.', 'danger')
+            return redirect(url_for('courses.list_courses'))
+
+    try:
+        stats = grade_exam(exam_id, current_user.user_id)
+
+        audit.record(
+            user_id=current_user.user_id,
+            action='auto_grade_exam',
+            entity_type='exam',
+            entity_id=exam_id,
+            new_values={
+                'attempts': stats['attempts'],
+                'answers': stats['answers']
+            },
+            sync=True
+        )
+        db.session.commit()
+
+        current_app.logger.info(
+            f"Auto-graded {stats['attempts']} attempts of exam {exam_id} in "
+            f"{stats['seconds']:.3f}s ({stats['attempts_per_second']:.1f} attempts/s)"
+        )
+        flash(f"Auto-graded {stats['attempts']} attempts "
+              f"({stats['attempts_per_second']:.1f} attempts/s).", 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'An error occurred during auto-grading: {str(e)}', 'danger')
+
+    return redirect(url_for('grading.list_attempts', exam_id=exam_id))
@@ -0,0 +1,118 @@
+from queue import Queue, Empty, Full
+from threading import Lock, Thread
+from time import sleep
+from sqlalchemy.exc import DBAPIError
+from app.models import db
+from app.scoring import grade_exam
+
+
+def is_deadlock(error):
+    """True for SQL Server deadlock victims (error 1205) and similar driver errors."""
+    message = str(getattr(error, 'orig', error)).lower()
+    return '1205' in message or 'deadlock' in message
+
+
+class GradingQueue:
+    """Bounded job queue of submitted attempts drained by a pool of grading threads.
+
+    Jobs are deduplicated while queued, so re-submitting an attempt is
+    harmless, and grading itself is idempotent. Workers pull several jobs at
+    a time and grade them per exam in one vectorized pass.
+    """
+
+    def __init__(self, workers=2, max_size=1000, max_retries=3, batch_size=50):
+        self.app = None
+        self.workers = workers
+        self.max_size = max_size
+        self.max_retries = max_retries
+        self.batch_size = batch_size
+        self._queue = None
+        self._queued = set()
+        self._lock = Lock()
+        self._threads = []
+        self.graded = 0
+        self.rejected = 0
+        self.retries = 0
+        self.failures = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('GRADING_WORKERS', self.workers)
+        self.max_size = app.config.get('GRADING_QUEUE_SIZE', self.max_size)
+        self.max_retries = app.config.get('GRADING_MAX_RETRIES', self.max_retries)
+        self._queue = Queue(maxsize=self.max_size)
+        for index in range(self.workers):
+            thread = Thread(target=self._run, name=f'grading-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def depth(self):
+        return self._queue.qsize() if self._queue else 0
+
+    def enqueue(self, exam_id, attempt_id):
+        """Queue an attempt for grading; returns False when the queue is full."""
+        if self._queue is None:
+            return False
+        with self._lock:
+            if attempt_id in self._queued:
+                return True
+            try:
+                self._queue.put_nowait((exam_id, attempt_id))
+            except Full:
+                self.rejected += 1
+                return False
+            self._queued.add(attempt_id)
+        return True
+
+    def _take_batch(self):
+        jobs = [self._queue.get()]
+        while len(jobs) < self.batch_size:
+            try:
+                jobs.append(self._queue.get_nowait())
+            except Empty:
+                break
+        with self._lock:
+            self._queued.difference_update(attempt_id for _, attempt_id in jobs)
+        return jobs
+
+    def _run(self):
+        while True:
+            jobs = self._take_batch()
+            by_exam = {}
+            for exam_id, attempt_id in jobs:
+                by_exam.setdefault(exam_id, []).append(attempt_id)
+            with self.app.app_context():
+                for exam_id, attempt_ids in by_exam.items():
+                    self._grade(exam_id, attempt_ids)
+            for _ in jobs:
+                self._queue.task_done()
+
+    def _grade(self, exam_id, attempt_ids):
+        for attempt in range(self.max_retries + 1):
+            try:
+                stats = grade_exam(exam_id, None, attempt_ids=attempt_ids, finalize=False)
+                db.session.commit()
+                self.graded += stats['attempts']
+                return
+            except DBAPIError as e:
+                db.session.rollback()
+                if not is_deadlock(e) or attempt == self.max_retries:
+                    self._fail(exam_id, attempt_ids, e)
+                    return
+                self.retries += 1
+                sleep(0.1 * 2 ** attempt)
+            except Exception as e:
+                db.session.rollback()
+                self._fail(exam_id, attempt_ids, e)
+                return
+            finally:
+                db.session.remove()
+
+    def _fail(self, exam_id, attempt_ids, error):
+        self.failures += 1
+        self.app.logger.error(
+            f"Error grading attempts {attempt_ids} of exam {exam_id}: {str(error)}"
+        )
+
+
+grading_queue = GradingQueue()
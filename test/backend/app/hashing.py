@@ -0,0 +1,25 @@
+# Runs inside the password hashing pool processes. Keep it to hashing code:
+# no Flask, database or service imports, so loading it never builds an app.
+import hashlib
+import hmac
+import bcrypt
+
+# Hashes written by migrations/database_setup.py before bcrypt was adopted.
+LEGACY_PBKDF2_ITERATIONS = 100000
+
+
+def hash_password(password, rounds):
+    salt = bcrypt.gensalt(rounds)
+    return salt.decode('utf-8'), bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+
+def verify_password(password, password_hash, salt):
+    if password_hash.startswith('$2'):
+        try:
+            return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+        except ValueError:
+            return False
+    digest = hashlib.pbkdf2_hmac(
+        'sha256', password.encode('utf-8'), (salt or '').encode('utf-8'), LEGACY_PBKDF2_ITERATIONS
+    ).hex()
+    return hmac.compare_digest(digest, password_hash)
@@ -1,122 +1,266 @@
-from flask import Blueprint, jsonify
-from app.models import Heartbeat
+from flask import Blueprint, jsonify, request, current_app, Response
+from flask_login import login_required, current_user
+from app.models import HeartbeatRollup, Exam
 from app import db
+from collections import deque, namedtuple
 from datetime import datetime, timedelta
-import socket
-import requests
+from threading import Lock
+from sqlalchemy import text
+import hmac
+import math
 import time
-from app.utils import scheduler
-from apscheduler.schedulers.background import BackgroundScheduler
+from app.utils import scheduler, role_required
+from app.presence import presence
+from app.authz import authz
+from app.identity import principals
+from app.leader import leader
+from app.querystats import query_profiler
+from app.metrics import render_prometheus
 
 heartbeat = Blueprint('heartbeat', __name__)
 
+Sample = namedtuple('Sample', ['timestamp', 'status', 'message', 'latency_ms'])
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(values)))
+    return values[rank - 1]
+
+
+class HeartbeatMonitor:
+    """Fixed-size in-memory ring buffer of heartbeat samples per component.
+
+    Samples never touch the database directly; flush_heartbeat_rollups() writes one
+    heartbeat_rollups row per component per completed minute.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self._samples = {}
+        self._rolled_up_to = {}
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.capacity = app.config.get('HEARTBEAT_BUFFER_SIZE', self.capacity)
+
+    def record(self, component, status, message=None, latency_ms=None):
+        sample = Sample(datetime.utcnow(), status, message, latency_ms)
+        with self._lock:
+            samples = self._samples.get(component)
+            if samples is None:
+                samples = self._samples[component] = deque(maxlen=self.capacity)
+            samples.append(sample)
+        return sample
+
+    def latest(self, component):
+        with self._lock:
+            samples = self._samples.get(component)
+            return samples[-1] if samples else None
+
+    def snapshot(self, component):
+        with self._lock:
+            return list(self._samples.get(component, ()))
+
+    def collect_rollups(self, now=None):
+        """Aggregate samples of every completed minute not yet rolled up.
+
+        Returns (rollups, watermark); pass the watermark to mark_rolled_up()
+        once the rollups are committed, so a failed write is retried.
+        """
+        current_minute = (now or datetime.utcnow()).replace(second=0, microsecond=0)
+        with self._lock:
+            pending = {
+                component: [
+                    sample for sample in samples
+                    if sample.timestamp >= self._rolled_up_to.get(component, datetime.min)
+                    and sample.timestamp < current_minute
+                ]
+                for component, samples in self._samples.items()
+            }
+        watermark = {component: current_minute for component in pending}
+
+        rollups = []
+        for component, samples in pending.items():
+            minutes = {}
+            for sample in samples:
+                minutes.setdefault(sample.timestamp.replace(second=0, microsecond=0), []).append(sample)
+            for minute, bucket in sorted(minutes.items()):
+                latencies = sorted(s.latency_ms for s in bucket if s.latency_ms is not None)
+                rollups.append({
+                    'component': component,
+                    'minute': minute,
+                    'up_count': sum(1 for s in bucket if s.status == 'up'),
+                    'down_count': sum(1 for s in bucket if s.status != 'up'),
+                    'last_status': bucket[-1].status,
+                    'last_message': (bucket[-1].message or '')[:255],
+                    'latency_p50_ms': percentile(latencies, 50),
+                    'latency_p95_ms': percentile(latencies, 95),
+                    'latency_p99_ms': percentile(latencies, 99)
+                })
+        return rollups, watermark
+
+    def mark_rolled_up(self, watermark):
+        with self._lock:
+            for component, minute in watermark.items():
+                if minute > self._rolled_up_to.get(component, datetime.min):
+                    self._rolled_up_to[component] = minute
+
+
+monitor = HeartbeatMonitor()
+
+
 def check_server_heartbeat():
-    try:
-        heartbeat = Heartbeat(
-            component='server',
-            status='up',
-            message='Server is running'
-        )
-        db.session.add(heartbeat)
-        db.session.commit()
-        return True
-    except Exception as e:
-        heartbeat = Heartbeat(
-            component='server',
-            status='down',
-            message=f'Server error: {str(e)}'
-        )
-        db.session.add(heartbeat)
-        db.session.commit()
-        return False
+    """Record that this server process is alive."""
+    monitor.record('server', 'up', 'Server is running', 0.0)
+    return True
 
 def check_database_heartbeat():
+    """Probe the database and record the round-trip latency."""
+    started = time.perf_counter()
     try:
-        result = db.session.execute('SELECT 1').fetchone()
+        result = db.session.execute(text('SELECT 1')).fetchone()
+        latency_ms = (time.perf_counter() - started) * 1000
         if result and result[0] == 1:
-            heartbeat = Heartbeat(
-                component='database',
-                status='up',
-                message='Database is responsive'
-            )
-            db.session.add(heartbeat)
-            db.session.commit()
+            monitor.record('database', 'up', 'Database is responsive', latency_ms)
             return True
-    except Exception as e:
-        heartbeat = Heartbeat(
-            component='database',
-            status='down',
-            message=f'Database error: {str(e)}'
-        )
-        db.session.add(heartbeat)
-        db.session.commit()
+        monitor.record('database', 'down', 'Unexpected probe result', latency_ms)
         return False
-
-def check_client_heartbeat(client_ip):
-    try:
-        heartbeat = Heartbeat(
-            component='client',
-            status='up',
-            message=f'Client {client_ip} last seen'
-        )
-        db.session.add(heartbeat)
-        db.session.commit()
-        return True
     except Exception as e:
-        heartbeat = Heartbeat(
-            component='client',
-            status='down',
-            message=f'Client error: {str(e)}'
-        )
-        db.session.add(heartbeat)
-        db.session.commit()
+        db.session.rollback()
+        monitor.record('database', 'down', f'Database error: {str(e)}',
+                       (time.perf_counter() - started) * 1000)
         return False
 
+def check_client_heartbeat(client_ip, attempt_id=None, exam_id=None):
+    """Refresh a client's presence; only online/offline transitions are persisted."""
+    key = f'attempt:{attempt_id}' if attempt_id else f'client:{client_ip}'
+    presence.touch(key, exam_id)
+    return True
+
+def flush_heartbeat_rollups():
+    """Write per-minute heartbeat rollups for completed minutes."""
+    with scheduler.app.app_context():
+        rollups, watermark = monitor.collect_rollups()
+        if not rollups:
+            monitor.mark_rolled_up(watermark)
+            return
+        try:
+            db.session.bulk_insert_mappings(HeartbeatRollup, rollups)
+            db.session.commit()
+            monitor.mark_rolled_up(watermark)
+        except Exception as e:
+            db.session.rollback()
+            scheduler.app.logger.error(f"Error writing heartbeat rollups: {str(e)}")
+
+def flush_presence_transitions():
+    """Persist batched client online/offline transitions."""
+    presence.flush()
+
+def run_scheduled_checks():
+    """Periodic server and database probes."""
+    with scheduler.app.app_context():
+        check_server_heartbeat()
+        check_database_heartbeat()
+
+def sample_response(sample):
+    return jsonify({
+        'status': sample.status if sample else 'unknown',
+        'timestamp': sample.timestamp.isoformat() if sample else datetime.utcnow().isoformat(),
+        'latency_ms': sample.latency_ms if sample else None
+    })
+
 @heartbeat.route('/api/heartbeat/server', methods=['GET'])
 def server_heartbeat():
-    status = check_server_heartbeat()
+    check_server_heartbeat()
+    return sample_response(monitor.latest('server'))
+
+@heartbeat.route('/api/heartbeat/database', methods=['GET'])
+def database_heartbeat():
+    # Answered from the last probe; only the scheduler leader probes on a timer, so
+    # other workers probe themselves on a cold start or once their sample goes stale.
+    sample = monitor.latest('database')
+    max_age = timedelta(seconds=2 * current_app.config.get('HEARTBEAT_INTERVAL', 300))
+    if sample is None or datetime.utcnow() - sample.timestamp > max_age:
+        check_database_heartbeat()
+        sample = monitor.latest('database')
+    return sample_response(sample)
+
+@heartbeat.route('/api/heartbeat/client/<client_ip>', methods=['GET'])
+def client_heartbeat(client_ip):
+    status = check_client_heartbeat(
+        client_ip,
+        attempt_id=request.args.get('attempt_id', type=int),
+        exam_id=request.args.get('exam_id', type=int)
+    )
     return jsonify({
         'status': 'up' if status else 'down',
         'timestamp': datetime.utcnow().isoformat()
     })
 
-@heartbeat.route('/api/heartbeat/database', methods=['GET'])
-def database_heartbeat():
-    status = check_database_heartbeat()
+@heartbeat.route('/api/heartbeat/exams/<int:exam_id>/online', methods=['GET'])
+@login_required
+@role_required(['admin', 'professor'])
+def exam_presence(exam_id):
+    if current_user.role != 'admin':
+        exam = Exam.query.get_or_404(exam_id)
+        if not authz.is_professor(current_user.user_id, exam.course_id):
+            return jsonify({'error': 'You are not authorized to view this exam.'}), 403
+
     return jsonify({
-        'status': 'up' if status else 'down',
+        'exam_id': exam_id,
+        'online': presence.online_count(exam_id),
+        'clients': presence.online(exam_id),
         'timestamp': datetime.utcnow().isoformat()
     })
 
-@heartbeat.route('/api/heartbeat/client/<client_ip>', methods=['GET'])
-def client_heartbeat(client_ip):
-    status = check_client_heartbeat(client_ip)
+@heartbeat.route('/api/heartbeat/caches', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def cache_stats():
     return jsonify({
-        'status': 'up' if status else 'down',
+        'principals': principals.stats(),
+        'course_memberships': authz.stats(),
         'timestamp': datetime.utcnow().isoformat()
     })
 
-def init_scheduled_heartbeats():
-    scheduler = BackgroundScheduler()
-    
-
-    scheduler.add_job(
-        func=check_server_heartbeat,
-        trigger='interval',
-        minutes=5,
-        id='server_heartbeat',
-        name='Check server status every 5 minutes',
-        replace_existing=True
-    )
-    
-
-    scheduler.add_job(
-        func=check_database_heartbeat,
-        trigger='interval',
-        minutes=5,
-        id='database_heartbeat',
-        name='Check database status every 5 minutes',
-        replace_existing=True
-    )
-    
-    scheduler.start()
\ No newline at end of file
+@heartbeat.route('/api/heartbeat/scheduler', methods=['GET'])
+@login_required
+@role_required(['admin'])
+def scheduler_status():
+    return jsonify(dict(leader.stats(), timestamp=datetime.utcnow().isoformat()))
+
+@heartbeat.route('/api/heartbeat/queries', methods=['GET', 'DELETE'])
+@login_required
+@role_required(['admin'])
+def query_stats():
+    if request.method == 'DELETE':
+        query_profiler.reset()
+    return jsonify(dict(query_profiler.stats(), timestamp=datetime.utcnow().isoformat()))
+
+def runtime_gauges():
+    """Point-in-time gauges for /metrics, all read from process memory."""
+    from app.audit import audit
+    from app.grading_queue import grading_queue
+    from app.deadlines import deadline_sweeper
+    pool = db.engine.pool
+    if hasattr(pool, 'checkedout'):
+        yield 'db_pool_size', 'Configured connection pool size.', (), pool.size()
+        yield 'db_pool_checked_out', 'Connections currently checked out.', (), pool.checkedout()
+        yield 'db_pool_overflow', 'Connections open beyond the pool size.', (), pool.overflow()
+    yield 'scheduler_is_leader', 'Whether this process holds the scheduler lease.', (), int(leader.is_leader())
+    yield 'audit_queue_depth', 'Audit events waiting to be written.', (), audit.depth()
+    yield 'grading_queue_depth', 'Attempts waiting to be graded.', (), grading_queue.depth()
+    yield 'pending_attempt_deadlines', 'In-progress attempts tracked by the deadline sweeper.', (), len(deadline_sweeper)
+
+@heartbeat.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # No login and no database access, so scrapes keep working while the database is down.
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(
+        request.headers.get('Authorization', '').encode('utf-8'), f'Bearer {token}'.encode('utf-8')
+    ):
+        return jsonify({'error': 'Authentication required.'}), 401
+    return Response(render_prometheus(runtime_gauges()), mimetype='text/plain; version=0.0.4')
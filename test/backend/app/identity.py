@@ -0,0 +1,108 @@
+from collections import namedtuple
+from threading import Lock
+from time import monotonic
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from app.models import db, User
+from app.exam_cache import LRUCache
+
+
+class Principal(namedtuple('Principal', [
+    'user_id', 'role', 'is_active', 'username', 'first_name', 'last_name'
+])):
+    """Read-only identity used as current_user instead of a session-bound User."""
+
+    __slots__ = ()
+    is_anonymous = False
+
+    @property
+    def is_authenticated(self):
+        # Mirrors User: deactivated accounts fail login_required even with a live session.
+        return bool(self.is_active)
+
+    def get_id(self):
+        return str(self.user_id)
+
+
+class PrincipalCache:
+    """TTL cache of Principals keyed by user_id for the flask_login user loader.
+
+    Entries are dropped after a commit that changes a user's role or
+    is_active flag, so deactivation takes effect on the next request in
+    this process and within the TTL everywhere else.
+    """
+
+    def __init__(self, ttl_seconds=60, max_size=10000):
+        self.ttl_seconds = ttl_seconds
+        self._cache = LRUCache(max_size)
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self.ttl_seconds = app.config.get('USER_CACHE_TTL', self.ttl_seconds)
+        self._cache = LRUCache(app.config.get('USER_CACHE_SIZE', self._cache.maxsize))
+
+    def get(self, user_id):
+        cached = self._cache.get(user_id)
+        if cached is not None and cached[0] > monotonic():
+            with self._lock:
+                self.hits += 1
+            return cached[1]
+
+        with self._lock:
+            self.misses += 1
+        row = db.session.query(
+            User.user_id, User.role, User.is_active, User.username, User.first_name, User.last_name
+        ).filter(User.user_id == user_id).first()
+        if row is None:
+            self._cache.pop(user_id)
+            return None
+        principal = Principal(*row)
+        self._cache.put(user_id, (monotonic() + self.ttl_seconds, principal))
+        return principal
+
+    def invalidate(self, user_id):
+        self._cache.pop(user_id)
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'invalidations': self.invalidations
+        }
+
+
+principals = PrincipalCache()
+
+
+def _mark_changed(target, value, oldvalue, initiator):
+    session = object_session(target)
+    if session is not None and target.user_id is not None and value != oldvalue:
+        session.info.setdefault('principal_changes', set()).add(target.user_id)
+
+
+def _mark_deleted(mapper, connection, target):
+    object_session(target).info.setdefault('principal_changes', set()).add(target.user_id)
+
+
+def _invalidate_committed(session):
+    for user_id in session.info.pop('principal_changes', ()):
+        principals.invalidate(user_id)
+
+
+def _discard_changes(session, previous_transaction):
+    session.info.pop('principal_changes', None)
+
+
+event.listen(User.role, 'set', _mark_changed)
+event.listen(User.is_active, 'set', _mark_changed)
+event.listen(User, 'after_delete', _mark_deleted)
+event.listen(Session, 'after_commit', _invalidate_committed)
+event.listen(Session, 'after_soft_rollback', _discard_changes)
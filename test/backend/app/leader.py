@@ -0,0 +1,219 @@
+import atexit
+import os
+import socket
+import uuid
+from datetime import datetime
+from functools import wraps
+from threading import Lock
+from time import monotonic, perf_counter
+from sqlalchemy import and_, or_, case, func, text
+from sqlalchemy.exc import IntegrityError
+from app.models import db, SchedulerLease
+from app.metrics import metrics
+
+
+def _db_now():
+    return func.sysutcdatetime()
+
+
+def _db_expiry(ttl_seconds):
+    return func.dateadd(text('second'), ttl_seconds, func.sysutcdatetime())
+
+
+class LeaderLease:
+    """Leader election through a lease row in scheduler_leases.
+
+    Every process renews (or tries to take over) the lease on a short
+    interval. Expiry is judged by the database clock, so hosts with skewed
+    clocks cannot both believe they hold it. Locally, leadership is only
+    trusted until the last successful renewal plus the TTL minus one renew
+    interval, so a leader that cannot reach the database stops running jobs
+    before anyone else can acquire the lease. Failover therefore completes
+    within ttl_seconds + renew_seconds.
+    """
+
+    def __init__(self, name='scheduler', ttl_seconds=30, renew_seconds=10):
+        self.app = None
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.renew_seconds = renew_seconds
+        self.holder = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._lock = Lock()
+        self._valid_until = 0.0
+        self.epoch = None
+        self.acquired = 0
+        self.renewed = 0
+        self.lost = 0
+        self.errors = 0
+        self.last_renewed_at = None
+        self.leader_since = None
+        self.jobs = {}
+
+    def init_app(self, app):
+        self.app = app
+        self.name = app.config.get('SCHEDULER_LEASE_NAME', self.name)
+        self.ttl_seconds = app.config.get('SCHEDULER_LEASE_TTL', self.ttl_seconds)
+        self.renew_seconds = app.config.get('SCHEDULER_LEASE_RENEW', self.renew_seconds)
+        atexit.register(self.release)
+
+    def is_leader(self):
+        return monotonic() < self._valid_until
+
+    def renew(self):
+        """Renew the lease if we hold it or take it over if it expired; returns leadership."""
+        was_leader = self.is_leader()
+        started = monotonic()
+        try:
+            table = SchedulerLease.__table__
+            result = db.session.execute(
+                table.update().where(and_(
+                    table.c.name == self.name,
+                    or_(table.c.holder == self.holder, table.c.expires_at < _db_now())
+                )).values(
+                    epoch=case((table.c.holder == self.holder, table.c.epoch), else_=table.c.epoch + 1),
+                    acquired_at=case((table.c.holder == self.holder, table.c.acquired_at), else_=_db_now()),
+                    holder=self.holder,
+                    renewed_at=_db_now(),
+                    expires_at=_db_expiry(self.ttl_seconds)
+                )
+            )
+            held = result.rowcount == 1
+            if not held and db.session.query(SchedulerLease.name).filter(
+                SchedulerLease.name == self.name
+            ).first() is None:
+                db.session.execute(table.insert().values(
+                    name=self.name,
+                    holder=self.holder,
+                    epoch=1,
+                    acquired_at=_db_now(),
+                    renewed_at=_db_now(),
+                    expires_at=_db_expiry(self.ttl_seconds)
+                ))
+                held = True
+            db.session.commit()
+            if held:
+                self.epoch = db.session.query(SchedulerLease.epoch).filter(
+                    SchedulerLease.name == self.name
+                ).scalar()
+        except IntegrityError:
+            # Another process inserted the row first; it is the leader for this round.
+            db.session.rollback()
+            held = False
+        except Exception as e:
+            db.session.rollback()
+            held = False
+            with self._lock:
+                self.errors += 1
+            self.app.logger.error(f"Error renewing scheduler lease: {str(e)}")
+            # Keep whatever validity is left; it runs out before the lease can be taken over.
+            return self.is_leader()
+
+        with self._lock:
+            if held:
+                self._valid_until = started + self.ttl_seconds - self.renew_seconds
+                self.last_renewed_at = datetime.utcnow()
+                if was_leader:
+                    self.renewed += 1
+                else:
+                    self.acquired += 1
+                    self.leader_since = self.last_renewed_at
+            else:
+                self._valid_until = 0.0
+                if was_leader:
+                    self.lost += 1
+                self.leader_since = None
+
+        if held and not was_leader:
+            self.app.logger.info(f"{self.holder} acquired scheduler lease '{self.name}' (epoch {self.epoch})")
+        elif was_leader and not held:
+            self.app.logger.warning(f"{self.holder} lost scheduler lease '{self.name}'")
+        return held
+
+    def release(self):
+        """Give the lease up on shutdown so a standby takes over on its next renewal."""
+        if not self.is_leader() or self.app is None:
+            return
+        self._valid_until = 0.0
+        with self.app.app_context():
+            try:
+                table = SchedulerLease.__table__
+                db.session.execute(table.update().where(and_(
+                    table.c.name == self.name, table.c.holder == self.holder
+                )).values(expires_at=_db_now()))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+
+    def _job_stats(self, job_name):
+        stats = self.jobs.get(job_name)
+        if stats is None:
+            stats = self.jobs[job_name] = {
+                'runs': 0, 'skipped': 0, 'failures': 0,
+                'last_run_at': None, 'last_duration_seconds': None, 'total_seconds': 0.0
+            }
+        return stats
+
+    def run_job(self, job_name, fn, leader_only=True):
+        """Run a job body, skipping it on followers, and record its timing."""
+        if leader_only and not self.is_leader():
+            with self._lock:
+                self._job_stats(job_name)['skipped'] += 1
+            return None
+
+        started = perf_counter()
+        failed = False
+        try:
+            return fn()
+        except Exception:
+            failed = True
+            raise
+        finally:
+            duration = perf_counter() - started
+            metrics.observe('scheduler_job_duration_seconds', duration, (('job', job_name),))
+            if failed:
+                metrics.inc('scheduler_job_failures_total', (('job', job_name),))
+            with self._lock:
+                stats = self._job_stats(job_name)
+                stats['runs'] += 1
+                stats['failures'] += 1 if failed else 0
+                stats['last_run_at'] = datetime.utcnow().isoformat()
+                stats['last_duration_seconds'] = duration
+                stats['total_seconds'] += duration
+
+    def stats(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'holder': self.holder,
+                'is_leader': self.is_leader(),
+                'epoch': self.epoch,
+                'leader_since': self.leader_since.isoformat() if self.leader_since else None,
+                'last_renewed_at': self.last_renewed_at.isoformat() if self.last_renewed_at else None,
+                'ttl_seconds': self.ttl_seconds,
+                'renew_seconds': self.renew_seconds,
+                'max_failover_seconds': self.ttl_seconds + self.renew_seconds,
+                'acquired': self.acquired,
+                'renewed': self.renewed,
+                'lost': self.lost,
+                'errors': self.errors,
+                'jobs': {name: dict(stats) for name, stats in self.jobs.items()}
+            }
+
+
+leader = LeaderLease()
+
+
+def leader_only(job_name, fn):
+    """Wrap a scheduled job so it only runs in the process holding the lease."""
+    @wraps(fn)
+    def job():
+        return leader.run_job(job_name, fn)
+    return job
+
+
+def timed(job_name, fn):
+    """Wrap a per-process scheduled job so its runs are timed like leader jobs."""
+    @wraps(fn)
+    def job():
+        return leader.run_job(job_name, fn, leader_only=False)
+    return job
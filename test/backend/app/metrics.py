@@ -0,0 +1,190 @@
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from flask import g, request
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 1800.0)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests handled, by endpoint, method and status.', None),
+    'http_request_errors_total': ('counter', 'Requests that ended with a 5xx status.', None),
+    'http_request_duration_seconds': ('histogram', 'Request latency by endpoint.', LATENCY_BUCKETS),
+    'db_pool_checkout_wait_seconds': ('histogram', 'Time spent waiting for a pooled connection.', POOL_WAIT_BUCKETS),
+    'db_pool_checkout_timeouts_total': ('counter', 'Connection checkouts that timed out.', None),
+    'scheduler_job_duration_seconds': ('histogram', 'Scheduled job run time, by job.', JOB_BUCKETS),
+    'scheduler_job_failures_total': ('counter', 'Scheduled job runs that raised.', None),
+}
+
+
+class _Shard:
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+
+class MetricsRegistry:
+    """Per-process counters and histograms kept in per-thread shards.
+
+    Each thread only ever writes its own shard, so recording takes no lock;
+    a lock is taken once per thread to register the shard. Export sums the
+    shards, so totals survive threads exiting. Nothing here touches the
+    database, which keeps the metrics endpoint answerable when it is down.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name, labels=(), amount=1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        buckets = METRICS[name][2]
+        histograms = self._shard().histograms
+        key = (name, labels)
+        counts = histograms.get(key)
+        if counts is None:
+            # One slot per bucket plus +Inf, then sum and count.
+            counts = histograms[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+        counts[bisect_left(buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def collect(self):
+        """Merge all shards into ({(name, labels): value}, {(name, labels): counts})."""
+        with self._lock:
+            shards = list(self._shards)
+        counters = {}
+        histograms = {}
+        for shard in shards:
+            for key, value in list(shard.counters.items()):
+                counters[key] = counters.get(key, 0) + value
+            for key, counts in list(shard.histograms.items()):
+                merged = histograms.get(key)
+                if merged is None:
+                    histograms[key] = list(counts)
+                else:
+                    for i, value in enumerate(counts):
+                        merged[i] += value
+        return counters, histograms
+
+
+metrics = MetricsRegistry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(gauges=()):
+    """Render every metric in the Prometheus text exposition format (version 0.0.4).
+
+    gauges is an iterable of (name, help, labels, value) read at scrape time.
+    """
+    counters, histograms = metrics.collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+            continue
+        for (metric, labels), counts in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(counts[-2])}')
+            lines.append(f'{name}_count{_format_labels(labels)} {counts[-1]}')
+
+    seen = set()
+    for name, help_text, labels, value in gauges:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection.
+
+    The wait includes opening a new connection when the pool grows.
+    create_app sets it as the poolclass unless the config chooses another.
+    """
+
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            metrics.inc('db_pool_checkout_timeouts_total')
+            raise
+        finally:
+            metrics.observe('db_pool_checkout_wait_seconds', perf_counter() - started)
+
+
+class RequestMetrics:
+    """Records request counts, errors and latency per endpoint from request hooks."""
+
+    def init_app(self, app):
+        app.before_request(self._begin)
+        app.after_request(self._finish)
+
+    def _begin(self):
+        g.metrics_started = perf_counter()
+
+    def _finish(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        blueprint = request.blueprint or ''
+        metrics.observe(
+            'http_request_duration_seconds', perf_counter() - started,
+            (('blueprint', blueprint), ('endpoint', endpoint))
+        )
+        metrics.inc('http_requests_total', (
+            ('blueprint', blueprint), ('endpoint', endpoint),
+            ('method', request.method), ('status', response.status_code)
+        ))
+        if response.status_code >= 500:
+            metrics.inc('http_request_errors_total', (('blueprint', blueprint), ('endpoint', endpoint)))
+        return response
+
+
+request_metrics = RequestMetrics()
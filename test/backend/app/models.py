@@ -1,12 +1,15 @@
 from app import db, login_manager
 from flask_login import UserMixin
 from datetime import datetime
-import bcrypt
 import jwt
 from time import time
 from app.config import Config
+from app.passwords import password_hasher, PasswordHasherBusy
+from flask import current_app, request, has_app_context, has_request_context
 from sqlalchemy import event
-from sqlalchemy.orm import validates
+from sqlalchemy.orm import validates, attributes, object_session, Session
+import json
+import random
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -36,11 +39,24 @@ class User(UserMixin, db.Model):
         return str(self.user_id)
     
     def set_password(self, password):
-        self.salt = bcrypt.gensalt().decode('utf-8')
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), self.salt.encode('utf-8')).decode('utf-8')
+        self.salt, self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return password_hasher.verify(password, self.password_hash, self.salt)
+    
+    def upgrade_password_hash(self, password):
+        """Rehash a legacy PBKDF2 or low-cost hash after a successful login; does not commit.
+
+        Best effort: if the hashing pool is saturated the upgrade is skipped and
+        retried on a later login. Returns True if the hash was replaced.
+        """
+        if not password_hasher.needs_rehash(self.password_hash):
+            return False
+        try:
+            self.set_password(password)
+        except PasswordHasherBusy:
+            return False
+        return True
     
     def get_reset_token(self, expires_in=600):
         return jwt.encode(
@@ -115,6 +131,8 @@ class Exam(db.Model):
     browser_lockdown = db.Column(db.Boolean, default=False)
     show_results_immediately = db.Column(db.Boolean, default=False)
     show_results_after = db.Column(db.DateTime)
+    # Bumped whenever questions or options change; keys the cached paper and answer key
+    content_version = db.Column(db.Integer, nullable=False, default=0)
     
 
     questions = db.relationship('Question', backref='exam', lazy=True)
@@ -149,6 +167,10 @@ class QuestionOption(db.Model):
     option_text = db.Column(db.Text, nullable=False)
     is_correct = db.Column(db.Boolean, default=False)
     display_order = db.Column(db.Integer, nullable=False)
+    
+    __table_args__ = (
+        db.Index('idx_question_options_order', 'question_id', 'display_order'),
+    )
 
 class ExamAttempt(db.Model):
     __tablename__ = 'exam_attempts'
@@ -164,6 +186,9 @@ class ExamAttempt(db.Model):
     total_score = db.Column(db.Numeric(5, 2))
     is_auto_submitted = db.Column(db.Boolean, default=False)
     
+    __table_args__ = (
+        db.Index('idx_attempts_exam_status', 'exam_id', 'status', 'submission_time'),
+    )
 
     answers = db.relationship('Answer', backref='attempt', lazy=True)
     
@@ -192,6 +217,10 @@ class Answer(db.Model):
     feedback = db.Column(db.Text)
     graded_by = db.Column(db.Integer, db.ForeignKey('users.user_id'))
     graded_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('uq_answers_attempt_question', 'attempt_id', 'question_id', unique=True),
+    )
 
 class ArchivedExam(db.Model):
     __tablename__ = 'archived_exams'
@@ -201,15 +230,55 @@ class ArchivedExam(db.Model):
     course_id = db.Column(db.Integer)
     exam_name = db.Column(db.String(100))
     exam_data = db.Column(db.Text)  
+    payload = db.Column(db.LargeBinary)
+    payload_codec = db.Column(db.String(20))
+    payload_index = db.Column(db.Text)
+    raw_bytes = db.Column(db.BigInteger)
+    stored_bytes = db.Column(db.BigInteger)
+    archive_seconds = db.Column(db.Float)
+    storage_location = db.Column(db.String(500))
+    checksum = db.Column(db.String(64))
+    tiered_at = db.Column(db.DateTime)
     archived_by = db.Column(db.Integer, db.ForeignKey('users.user_id'))
     archived_at = db.Column(db.DateTime, default=datetime.utcnow)
     archive_reason = db.Column(db.String(100))
 
+class ArchiveJobRun(db.Model):
+    __tablename__ = 'archive_job_runs'
+    
+    run_id = db.Column(db.Integer, primary_key=True)
+    job_name = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(30), nullable=False, default='running')
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    total = db.Column(db.Integer, default=0)
+    completed = db.Column(db.Integer, default=0)
+    failed = db.Column(db.Integer, default=0)
+    
+    items = db.relationship('ArchiveJobItem', backref='run', lazy=True)
+
+class ArchiveJobItem(db.Model):
+    __tablename__ = 'archive_job_items'
+    
+    item_id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('archive_job_runs.run_id'), nullable=False)
+    exam_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    duration_seconds = db.Column(db.Float)
+    error = db.Column(db.String(500))
+    
+    __table_args__ = (
+        db.UniqueConstraint('run_id', 'exam_id', name='_run_exam_uc'),
+    )
+
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
     
     log_id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'))
     action = db.Column(db.String(100), nullable=False)
     entity_type = db.Column(db.String(50))
     entity_id = db.Column(db.Integer)
@@ -218,6 +287,30 @@ class AuditLog(db.Model):
     ip_address = db.Column(db.String(50))
     user_agent = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_audit_logs_created', 'created_at'),
+    )
+
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+    
+    token_id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, nullable=False)
+    token_type = db.Column(db.String(10), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'))
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime)
+
+class SchedulerLease(db.Model):
+    __tablename__ = 'scheduler_leases'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(150), nullable=False)
+    epoch = db.Column(db.Integer, nullable=False, default=1)
+    acquired_at = db.Column(db.DateTime)
+    renewed_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, nullable=False)
 
 class Heartbeat(db.Model):
     __tablename__ = 'heartbeats'
@@ -227,43 +320,103 @@ class Heartbeat(db.Model):
     status = db.Column(db.String(20), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     message = db.Column(db.String(255))
+    
+    __table_args__ = (
+        db.Index('idx_heartbeats_component_time', 'component', 'timestamp'),
+    )
+
+class HeartbeatRollup(db.Model):
+    __tablename__ = 'heartbeat_rollups'
+    
+    rollup_id = db.Column(db.Integer, primary_key=True)
+    component = db.Column(db.String(50), nullable=False)
+    minute = db.Column(db.DateTime, nullable=False)
+    up_count = db.Column(db.Integer, nullable=False, default=0)
+    down_count = db.Column(db.Integer, nullable=False, default=0)
+    last_status = db.Column(db.String(20))
+    last_message = db.Column(db.String(255))
+    latency_p50_ms = db.Column(db.Float)
+    latency_p95_ms = db.Column(db.Float)
+    latency_p99_ms = db.Column(db.Float)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    from app.identity import principals
+    return principals.get(int(user_id))
+
+
+# Columns that are never copied into audit diffs. Archive payloads are excluded so tiering
+# them out of the database does not copy them back into audit_logs.
+AUDIT_IGNORED_COLUMNS = {
+    'password_hash', 'salt', 'updated_at', 'payload', 'exam_data', 'payload_index'
+}
+
+_audited_columns = {}
+
+
+def audited_columns(mapper):
+    """Return the audited column keys for a mapper, computed once per mapper."""
+    columns = _audited_columns.get(mapper)
+    if columns is None:
+        columns = tuple(
+            prop.key for prop in mapper.column_attrs if prop.key not in AUDIT_IGNORED_COLUMNS
+        )
+        _audited_columns[mapper] = columns
+    return columns
+
+
+def change_policy(table_name):
+    """Return the sampling rate for an entity type (0 disables tracking)."""
+    config = current_app.config if has_app_context() else vars(Config)
+    if table_name in config.get('AUDIT_CHANGES_EXCLUDE', ()):
+        return 0.0
+    return config.get('AUDIT_CHANGES_SAMPLE_RATES', {}).get(table_name, 1.0)
 
 
 def track_changes(mapper, connection, target):
-    if not target.user_id: 
+    table_name = mapper.local_table.name
+    rate = change_policy(table_name)
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
         return
-    
-
-    from flask_login import current_user
-    if current_user.is_authenticated:
-        user_id = current_user.user_id
-    else:
-        user_id = target.user_id 
-    
 
     old_values = {}
-    for attr in db.inspect(target).attrs:
-        if attr.history.has_changes():
-            old_values[attr.key] = attr.history.deleted[0] if attr.history.deleted else None
-    
-
-    audit_log = AuditLog(
-        user_id=user_id,
-        action='update',
-        entity_type=target.__tablename__,
-        entity_id=target.id,
-        old_values=str(old_values),
-        new_values=str({k: getattr(target, k) for k in old_values.keys()}),
-        ip_address=request.remote_addr if request else None,
-        user_agent=request.headers.get('User-Agent') if request else None
-    )
-    db.session.add(audit_log)
+    new_values = {}
+    for key in audited_columns(mapper):
+        history = attributes.get_history(target, key, passive=attributes.PASSIVE_NO_INITIALIZE)
+        if history.added or history.deleted:
+            old_values[key] = history.deleted[0] if history.deleted else None
+            new_values[key] = history.added[0] if history.added else None
+    if not new_values:
+        return
+
+    user_id = getattr(target, 'user_id', None)
+    if has_request_context():
+        from flask_login import current_user
+        if current_user.is_authenticated:
+            user_id = current_user.user_id
+
+    session = object_session(target)
+    session.info.setdefault('audit_changes', []).append({
+        'user_id': user_id,
+        'action': 'update',
+        'entity_type': table_name,
+        'entity_id': mapper.primary_key_from_instance(target)[0],
+        'old_values': json.dumps(old_values, default=str, separators=(',', ':')),
+        'new_values': json.dumps(new_values, default=str, separators=(',', ':')),
+        'ip_address': request.remote_addr if has_request_context() else None,
+        'user_agent': request.headers.get('User-Agent') if has_request_context() else None,
+        'created_at': datetime.utcnow()
+    })
+
+
+def write_tracked_changes(session, flush_context):
+    """Insert the diffs captured during this flush with one executemany in the same transaction."""
+    rows = session.info.pop('audit_changes', None)
+    if rows:
+        session.connection().execute(AuditLog.__table__.insert(), rows)
 
 
 models = [User, Course, CourseEnrollment, Exam, Question, QuestionOption, ExamAttempt, Answer, ArchivedExam]
 for model in models:
-    event.listen(model, 'after_update', track_changes)
\ No newline at end of file
+    event.listen(model, 'after_update', track_changes)
+event.listen(Session, 'after_flush', write_tracked_changes)
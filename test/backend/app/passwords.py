@@ -0,0 +1,160 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import BoundedSemaphore, Lock
+from time import perf_counter
+import bcrypt
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app.hashing import hash_password, verify_password
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool is saturated and the admission wait timed out."""
+
+
+def bcrypt_rounds(password_hash):
+    """Return the cost factor of a bcrypt hash, or None for legacy hashes."""
+    if not password_hash or not password_hash.startswith('$2'):
+        return None
+    return int(password_hash.split('$')[2])
+
+
+class PasswordHasher:
+    """Runs bcrypt in a dedicated process pool behind bounded admission.
+
+    Request threads wait on the result without holding the GIL while the
+    hash runs. At most workers + queue_size operations are admitted at
+    once; beyond that callers wait up to admission_timeout and then get
+    PasswordHasherBusy instead of piling up on the pool.
+    """
+
+    def __init__(self, workers=2, queue_size=32, admission_timeout=2.0, rounds=12):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.admission_timeout = admission_timeout
+        self.rounds = rounds
+        self._admission = BoundedSemaphore(workers + queue_size)
+        self._pool = None
+        self._pool_pid = None
+        self._lock = Lock()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    def init_app(self, app):
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.queue_size = app.config.get('PASSWORD_HASH_QUEUE_SIZE', self.queue_size)
+        self.admission_timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.admission_timeout)
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', self.rounds)
+        self._admission = BoundedSemaphore(self.workers + self.queue_size)
+        app.cli.add_command(calibrate_command)
+
+    def _executor(self):
+        # Created lazily so each forked server worker gets its own pool. By then the
+        # process runs scheduler and worker threads, so children come from a
+        # forkserver rather than a fork of this process. The fork server preloads
+        # only app.hashing instead of the default __main__, so it never builds an
+        # app. Pool children still re-run a main *script* as __mp_main__, so entry
+        # points must not create the app under that name (see migrations/app.py).
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['app.hashing'])
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _discard(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+                self.restarts += 1
+        pool.shutdown(wait=False)
+
+    def _submit(self, fn, *args):
+        pool = self._executor()
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            # A child died (e.g. OOM-killed); rebuild the pool and retry once.
+            self._discard(pool)
+            return self._executor().submit(fn, *args).result()
+
+    def _run(self, fn, *args):
+        if not self._admission.acquire(timeout=self.admission_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHasherBusy('Password hashing is saturated')
+        try:
+            result = self._submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            self._admission.release()
+        with self._lock:
+            self.completed += 1
+        return result
+
+    def hash(self, password):
+        """Return (salt, password_hash) for a new bcrypt hash."""
+        return self._run(hash_password, password, self.rounds)
+
+    def verify(self, password, password_hash, salt=None):
+        return self._run(verify_password, password, password_hash, salt)
+
+    def needs_rehash(self, password_hash):
+        """True for legacy PBKDF2 hashes and bcrypt hashes below the configured cost."""
+        rounds = bcrypt_rounds(password_hash)
+        return rounds is None or rounds < self.rounds
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'capacity': self.workers + self.queue_size,
+            'rounds': self.rounds,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'restarts': self.restarts
+        }
+
+
+password_hasher = PasswordHasher()
+
+
+def calibrate(target_ms, min_rounds=10, max_rounds=16, samples=3):
+    """Return the highest bcrypt cost whose median hash time is within target_ms, plus timings."""
+    password = b'calibration-password'
+    timings = []
+    chosen = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        salt = bcrypt.gensalt(rounds)
+        durations = []
+        for _ in range(samples):
+            started = perf_counter()
+            bcrypt.hashpw(password, salt)
+            durations.append((perf_counter() - started) * 1000)
+        median = sorted(durations)[len(durations) // 2]
+        timings.append((rounds, median))
+        if median > target_ms:
+            break
+        chosen = rounds
+    return chosen, timings
+
+
+@click.command('calibrate-bcrypt')
+@click.option('--target-ms', default=250, show_default=True,
+              help='Target time for one password hash on this host.')
+@with_appcontext
+def calibrate_command(target_ms):
+    """Pick BCRYPT_LOG_ROUNDS for a target hashing latency on this host."""
+    chosen, timings = calibrate(target_ms)
+    for rounds, median in timings:
+        click.echo(f'  cost {rounds:2d}: {median:8.1f} ms')
+    click.echo(f'BCRYPT_LOG_ROUNDS={chosen} (currently {current_app.config.get("BCRYPT_LOG_ROUNDS")})')
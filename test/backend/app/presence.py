@@ -0,0 +1,130 @@
+import math
+from datetime import datetime
+from threading import Lock
+from time import monotonic
+from app.models import db, Heartbeat
+
+
+class PresenceTracker:
+    """Client presence keyed by attempt or client IP with TTL expiry.
+
+    Entries live in a hash map and are bucketed in a timing wheel by the
+    tick at which they expire, so expiry costs O(expired) per tick and
+    "who is online for exam X" is a set lookup. Only transitions (came
+    online / went silent) are queued for persistence.
+    """
+
+    def __init__(self, ttl_seconds=30, tick_seconds=1.0):
+        self.app = None
+        self._lock = Lock()
+        self._configure(ttl_seconds, tick_seconds)
+
+    def _configure(self, ttl_seconds, tick_seconds):
+        self.tick_seconds = tick_seconds
+        self.ttl_ticks = max(1, int(math.ceil(ttl_seconds / tick_seconds)))
+        self._wheel = [set() for _ in range(self.ttl_ticks + 1)]
+        self._entries = {}
+        self._by_exam = {}
+        self._transitions = []
+        self._tick = self._now_tick()
+
+    def init_app(self, app):
+        self.app = app
+        with self._lock:
+            self._configure(
+                app.config.get('CLIENT_PRESENCE_TTL', 30),
+                app.config.get('CLIENT_PRESENCE_TICK', 1.0)
+            )
+
+    def _now_tick(self):
+        return int(monotonic() / self.tick_seconds)
+
+    def _advance(self, now_tick):
+        # Walk at most one full revolution; anything older has expired either way.
+        start = max(self._tick + 1, now_tick - len(self._wheel) + 1)
+        for tick in range(start, now_tick + 1):
+            slot = self._wheel[tick % len(self._wheel)]
+            for key in slot:
+                entry = self._entries.get(key)
+                if entry is not None and entry['deadline'] <= now_tick:
+                    self._expire(key, entry)
+            slot.clear()
+        self._tick = max(self._tick, now_tick)
+
+    def _expire(self, key, entry):
+        del self._entries[key]
+        members = self._by_exam.get(entry['exam_id'])
+        if members is not None:
+            members.discard(key)
+            if not members:
+                del self._by_exam[entry['exam_id']]
+        self._transitions.append((datetime.utcnow(), key, entry['exam_id'], 'down'))
+
+    def touch(self, key, exam_id=None):
+        """Mark a client as seen; returns True if it just came online."""
+        now_tick = self._now_tick()
+        with self._lock:
+            self._advance(now_tick)
+            deadline = now_tick + self.ttl_ticks
+            entry = self._entries.get(key)
+            came_online = entry is None
+            if came_online:
+                entry = self._entries[key] = {'exam_id': exam_id, 'deadline': deadline}
+                self._by_exam.setdefault(exam_id, set()).add(key)
+                self._transitions.append((datetime.utcnow(), key, exam_id, 'up'))
+            else:
+                entry['deadline'] = deadline
+            self._wheel[deadline % len(self._wheel)].add(key)
+        return came_online
+
+    def online_count(self, exam_id):
+        with self._lock:
+            self._advance(self._now_tick())
+            return len(self._by_exam.get(exam_id, ()))
+
+    def online(self, exam_id):
+        with self._lock:
+            self._advance(self._now_tick())
+            return sorted(self._by_exam.get(exam_id, ()))
+
+    def is_online(self, key):
+        with self._lock:
+            self._advance(self._now_tick())
+            return key in self._entries
+
+    def drain_transitions(self):
+        with self._lock:
+            self._advance(self._now_tick())
+            transitions, self._transitions = self._transitions, []
+        return transitions
+
+    def flush(self):
+        """Persist queued online/offline transitions as heartbeat rows in one batch."""
+        transitions = self.drain_transitions()
+        if not transitions:
+            return 0
+        rows = [
+            {
+                'component': 'client',
+                'status': status,
+                'timestamp': timestamp,
+                'message': (
+                    f'Client {key} came online' if status == 'up' else f'Client {key} went silent'
+                ) + (f' (exam {exam_id})' if exam_id is not None else '')
+            }
+            for timestamp, key, exam_id, status in transitions
+        ]
+        with self.app.app_context():
+            try:
+                db.session.bulk_insert_mappings(Heartbeat, rows)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"Error writing presence transitions: {str(e)}")
+                with self._lock:
+                    self._transitions[:0] = transitions
+                return 0
+        return len(rows)
+
+
+presence = PresenceTracker()
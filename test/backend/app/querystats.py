@@ -0,0 +1,148 @@
+import re
+from threading import Lock
+from time import perf_counter
+from flask import g, request, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """Normalize a statement so repeats differing only in IN-list length count as one shape."""
+    return _WHITESPACE.sub(' ', _IN_LIST.sub('(?...)', statement)).strip()
+
+
+class RequestProfile:
+    __slots__ = ('queries', 'seconds', 'shapes')
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.shapes = {}
+
+    def add(self, statement, seconds):
+        self.queries += 1
+        self.seconds += seconds
+        shape = statement_shape(statement)
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def repeated(self, threshold):
+        """Shapes issued more than threshold times, most repeated first."""
+        return sorted(
+            ((shape, count) for shape, count in self.shapes.items() if count > threshold),
+            key=lambda item: item[1], reverse=True
+        )
+
+
+class QueryProfiler:
+    """Counts SQL statements and database time per request from engine events.
+
+    Statements issued while a request is being handled are attributed to its
+    endpoint; background jobs have no profile and are ignored. A request that
+    repeats one statement shape more than n_plus_one_threshold times is logged
+    as a likely N+1 loop. Totals are aggregated per endpoint for stats().
+    """
+
+    def __init__(self, n_plus_one_threshold=10, max_suspects=5):
+        self.app = None
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.max_suspects = max_suspects
+        self.debug_headers = False
+        self._lock = Lock()
+        self._endpoints = {}
+
+    def init_app(self, app):
+        self.app = app
+        self.n_plus_one_threshold = app.config.get('SQL_N_PLUS_ONE_THRESHOLD', self.n_plus_one_threshold)
+        self.debug_headers = app.debug or app.config.get('SQL_DEBUG_HEADERS', False)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        app.before_request(self._begin)
+        app.after_request(self._finish)
+
+    def _begin(self):
+        g.sql_profile = RequestProfile()
+
+    def _finish(self, response):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        suspects = profile.repeated(self.n_plus_one_threshold)
+        for shape, count in suspects:
+            self.app.logger.warning(
+                f"Likely N+1 in {endpoint}: statement issued {count} times in one request "
+                f"({profile.queries} queries, {profile.seconds * 1000:.1f} ms total): {shape[:200]}"
+            )
+        self._aggregate(endpoint, profile, suspects)
+
+        if self.debug_headers:
+            response.headers['X-SQL-Queries'] = str(profile.queries)
+            response.headers['X-SQL-Time-Ms'] = f'{profile.seconds * 1000:.1f}'
+            response.headers['X-SQL-Max-Repeats'] = str(max(profile.shapes.values(), default=0))
+        return response
+
+    def _aggregate(self, endpoint, profile, suspects):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = {
+                    'requests': 0, 'queries': 0, 'db_seconds': 0.0,
+                    'max_queries': 0, 'flagged_requests': 0, 'suspects': {}
+                }
+            stats['requests'] += 1
+            stats['queries'] += profile.queries
+            stats['db_seconds'] += profile.seconds
+            stats['max_queries'] = max(stats['max_queries'], profile.queries)
+            if suspects:
+                stats['flagged_requests'] += 1
+            for shape, count in suspects:
+                known = stats['suspects'].get(shape)
+                if known is None and len(stats['suspects']) >= self.max_suspects:
+                    continue
+                stats['suspects'][shape] = max(known or 0, count)
+
+    def stats(self):
+        """Per-endpoint totals, heaviest database time first."""
+        with self._lock:
+            endpoints = [
+                dict(
+                    stats,
+                    endpoint=endpoint,
+                    avg_queries=stats['queries'] / stats['requests'],
+                    avg_db_ms=stats['db_seconds'] * 1000 / stats['requests'],
+                    suspects=[
+                        {'statement': shape, 'max_repeats': count}
+                        for shape, count in sorted(stats['suspects'].items(), key=lambda item: -item[1])
+                    ]
+                )
+                for endpoint, stats in self._endpoints.items()
+            ]
+        endpoints.sort(key=lambda stats: stats['db_seconds'], reverse=True)
+        return {
+            'n_plus_one_threshold': self.n_plus_one_threshold,
+            'endpoints': endpoints
+        }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+
+
+query_profiler = QueryProfiler()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('query_started', None)
+    if started is None or not has_app_context():
+        return
+    profile = g.get('sql_profile')
+    if profile is not None:
+        profile.add(statement, perf_counter() - started)
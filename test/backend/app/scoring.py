@@ -0,0 +1,132 @@
+from datetime import datetime
+from time import perf_counter
+import numpy as np
+from sqlalchemy import func, case
+from app.models import db, Question, ExamAttempt, Answer
+from app.exam_cache import get_answer_key, OBJECTIVE_TYPES
+
+
+GRADABLE_STATUSES = ['submitted', 'graded']
+
+
+def answer_key_arrays(exam_id):
+    """Return (question_ids, points, correct (question_index, option_id) pairs) for objective questions."""
+    key = get_answer_key(exam_id)
+    question_ids = sorted(
+        question_id for question_id, entry in key.questions.items()
+        if entry.question_type in OBJECTIVE_TYPES
+    )
+    points = [float(key.questions[question_id].points) for question_id in question_ids]
+    correct = [
+        (index, option_id)
+        for index, question_id in enumerate(question_ids)
+        for option_id in key.questions[question_id].correct_option_ids
+    ]
+    return np.array(question_ids, dtype=np.int64), np.array(points, dtype=np.float64), correct
+
+
+def grade_exam(exam_id, graded_by, attempt_ids=None, finalize=True):
+    """Score every submitted attempt of an exam in one pass and write results in bulk.
+
+    Objective answers are scored with NumPy against the exam's answer key;
+    points already awarded to essay/short-answer questions are kept and added
+    to each attempt's total. With finalize=False an attempt is only marked
+    graded once none of its subjective answers still await points. Grading is
+    idempotent and nothing is committed; returns grading stats.
+    """
+    started = perf_counter()
+
+    attempt_filter = [
+        ExamAttempt.exam_id == exam_id,
+        ExamAttempt.status.in_(GRADABLE_STATUSES)
+    ]
+    if attempt_ids is not None:
+        attempt_filter.append(ExamAttempt.attempt_id.in_(attempt_ids))
+
+    attempts = np.array(sorted(
+        row[0] for row in db.session.query(ExamAttempt.attempt_id).filter(*attempt_filter)
+    ), dtype=np.int64)
+    if attempts.size == 0:
+        return {'attempts': 0, 'answers': 0, 'seconds': 0.0, 'attempts_per_second': 0.0}
+
+    question_ids, points, correct = answer_key_arrays(exam_id)
+
+    answer_rows = db.session.query(
+        Answer.answer_id, Answer.attempt_id, Answer.question_id, Answer.selected_option_id
+    ).join(
+        ExamAttempt, ExamAttempt.attempt_id == Answer.attempt_id
+    ).join(
+        Question, Question.question_id == Answer.question_id
+    ).filter(
+        Question.question_type.in_(OBJECTIVE_TYPES), *attempt_filter
+    ).all()
+
+    # Points already awarded by hand to subjective questions, summed in the database.
+    subjective = db.session.query(
+        Answer.attempt_id,
+        func.sum(Answer.points_awarded),
+        func.sum(case((Answer.points_awarded == None, 1), else_=0))
+    ).join(
+        ExamAttempt, ExamAttempt.attempt_id == Answer.attempt_id
+    ).join(
+        Question, Question.question_id == Answer.question_id
+    ).filter(
+        ~Question.question_type.in_(OBJECTIVE_TYPES), *attempt_filter
+    ).group_by(Answer.attempt_id).all()
+
+    totals = np.zeros(attempts.size, dtype=np.float64)
+    pending = np.zeros(attempts.size, dtype=np.int64)
+    if subjective:
+        positions = np.searchsorted(attempts, np.array([row[0] for row in subjective], dtype=np.int64))
+        np.add.at(totals, positions, np.array([float(row[1] or 0) for row in subjective]))
+        np.add.at(pending, positions, np.array([int(row[2] or 0) for row in subjective]))
+
+    awarded = np.zeros(0, dtype=np.float64)
+    if answer_rows and question_ids.size:
+        table = np.array(
+            [(a, att, q, opt if opt is not None else -1) for a, att, q, opt in answer_rows],
+            dtype=np.int64
+        )
+        answer_ids, answer_attempts, answer_questions, selected = table.T
+
+        # Answer key: points indexed by question position, correct (question, option) pairs
+        # encoded as single integers so multi-correct questions need just one isin.
+        question_index = np.minimum(np.searchsorted(question_ids, answer_questions), question_ids.size - 1)
+        known = question_ids[question_index] == answer_questions
+        stride = int(max(selected.max(), max((o for _, o in correct), default=0))) + 1
+        key_codes = np.array([q * stride + o for q, o in correct], dtype=np.int64)
+        is_correct = known & (selected >= 0) & np.isin(question_index * stride + selected, key_codes)
+
+        awarded = np.where(is_correct, points[question_index], 0.0)
+        totals += np.bincount(
+            np.searchsorted(attempts, answer_attempts),
+            weights=awarded,
+            minlength=attempts.size
+        )
+
+        graded_at = datetime.utcnow()
+        db.session.bulk_update_mappings(Answer, [
+            {
+                'answer_id': int(answer_id),
+                'points_awarded': round(float(score), 2),
+                'graded_by': graded_by,
+                'graded_at': graded_at
+            }
+            for answer_id, score in zip(answer_ids, awarded)
+        ])
+
+    attempt_updates = []
+    for attempt_id, total, waiting in zip(attempts, totals, pending):
+        update = {'attempt_id': int(attempt_id), 'total_score': round(float(total), 2)}
+        if finalize or not waiting:
+            update['status'] = 'graded'
+        attempt_updates.append(update)
+    db.session.bulk_update_mappings(ExamAttempt, attempt_updates)
+
+    seconds = perf_counter() - started
+    return {
+        'attempts': int(attempts.size),
+        'answers': int(awarded.size),
+        'seconds': seconds,
+        'attempts_per_second': attempts.size / seconds if seconds else float(attempts.size)
+    }
@@ -0,0 +1,114 @@
+import hashlib
+import io
+import os
+from abc import ABC, abstractmethod
+from flask import current_app
+
+
+class ObjectStore(ABC):
+    """Minimal blob store interface used for cold archive payloads.
+
+    Locations are returned as '<scheme>:<key>' so a payload written by one
+    backend can still be read after the configured backend changes.
+    """
+
+    scheme = None
+
+    @abstractmethod
+    def put(self, key, data):
+        """Store data under key, replacing any existing object; returns its location."""
+
+    @abstractmethod
+    def get(self, key, offset=None, length=None):
+        """Return the object's bytes, or length bytes from offset."""
+
+    @abstractmethod
+    def delete(self, key):
+        """Remove the object stored under key."""
+
+    def location(self, key):
+        return f'{self.scheme}:{key}'
+
+
+class LocalFileStore(ObjectStore):
+    scheme = 'local'
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f'Invalid object key: {key}')
+        return path
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return self.location(key)
+
+    def get(self, key, offset=None, length=None):
+        with open(self._path(key), 'rb') as f:
+            if offset:
+                f.seek(offset)
+            return f.read(length) if length is not None else f.read()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class AzureBlobStore(ObjectStore):
+    scheme = 'azure'
+
+    def __init__(self, config):
+        self.config = config
+
+    def _blob(self, key):
+        from azure.storage.blob import BlobServiceClient
+        return BlobServiceClient.from_connection_string(
+            self.config['AZURE_STORAGE_CONNECTION_STRING']).get_blob_client(
+            container=self.config['AZURE_STORAGE_CONTAINER'], blob=key)
+
+    def put(self, key, data):
+        from app.utils import upload_to_azure_blob
+        # The upload helper does not overwrite; clear what a failed earlier run left behind.
+        blob = self._blob(key)
+        if blob.exists():
+            blob.delete_blob()
+        if upload_to_azure_blob(io.BytesIO(data), key, 'application/octet-stream') is None:
+            raise IOError(f'Upload of {key} to Azure Blob Storage failed')
+        return self.location(key)
+
+    def get(self, key, offset=None, length=None):
+        return self._blob(key).download_blob(offset=offset, length=length).readall()
+
+    def delete(self, key):
+        self._blob(key).delete_blob()
+
+
+def get_object_store(scheme=None, config=None):
+    """Return the store for a scheme, defaulting to the configured ARCHIVE_STORE."""
+    config = config or current_app.config
+    scheme = scheme or config.get('ARCHIVE_STORE', 'local')
+    if scheme == 'azure':
+        return AzureBlobStore(config)
+    return LocalFileStore(config.get('ARCHIVE_STORE_PATH', 'archive_store'))
+
+
+def resolve_location(location):
+    """Split a stored location into (store, key)."""
+    scheme, key = location.split(':', 1)
+    return get_object_store(scheme), key
+
+
+def checksum(data):
+    return hashlib.sha256(data).hexdigest()
@@ -1,8 +1,10 @@
 from functools import wraps
 from flask import abort, request, current_app
 from flask_login import current_user
-from app.models import AuditLog, Heartbeat, db, Exam, ExamAttempt, Answer, ArchivedExam
+from app.models import db, Exam, ArchivedExam, ArchiveJobRun, ArchiveJobItem
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 import pytz
@@ -10,6 +12,8 @@ import json
 from azure.storage.blob import BlobServiceClient
 import os
 from app.config import Config
+from app.audit import audit
+from app.archive import iter_exam_records, encode_records, available_codec, tier_archive
 from sqlalchemy import and_
 
 
@@ -21,17 +25,15 @@ def role_required(roles):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             if not current_user.is_authenticated or current_user.role not in roles:
-                audit_log = AuditLog(
+                audit.record(
                     user_id=current_user.user_id if current_user.is_authenticated else None,
                     action='unauthorized_access',
                     entity_type='route',
-                    entity_id=f.__name__,
-                    message=f'Attempted access to {request.path} requiring roles: {roles}',
-                    ip_address=request.remote_addr,
-                    user_agent=request.headers.get('User-Agent')
+                    new_values={
+                        'route': f.__name__,
+                        'message': f'Attempted access to {request.path} requiring roles: {roles}'
+                    }
                 )
-                db.session.add(audit_log)
-                db.session.commit()
                 abort(403)
             return f(*args, **kwargs)
         return decorated_function
@@ -45,51 +47,19 @@ def archive_exam(exam_id, archived_by, reason):
             return False, "Exam not found"
         
 
-        attempts = ExamAttempt.query.filter_by(
-            exam_id=exam_id,
-            status='graded'
-        ).all()
-        
-
-        exam_data = {
-            'exam_info': {
-                'exam_id': exam.exam_id,
-                'exam_name': exam.exam_name,
-                'course_id': exam.course_id,
-                'created_at': exam.created_at.isoformat(),
-            },
-            'attempts': []
-        }
-        
-        for attempt in attempts:
-            attempt_data = {
-                'attempt_id': attempt.attempt_id,
-                'user_id': attempt.user_id,
-                'start_time': attempt.start_time.isoformat(),
-                'submission_time': attempt.submission_time.isoformat() if attempt.submission_time else None,
-                'total_score': float(attempt.total_score) if attempt.total_score else None,
-                'answers': []
-            }
-            
-            answers = Answer.query.filter_by(attempt_id=attempt.attempt_id).all()
-            for answer in answers:
-                answer_data = {
-                    'question_id': answer.question_id,
-                    'answer_text': answer.answer_text,
-                    'selected_option_id': answer.selected_option_id,
-                    'points_awarded': float(answer.points_awarded) if answer.points_awarded else None,
-                    'feedback': answer.feedback,
-                    'graded_at': answer.graded_at.isoformat() if answer.graded_at else None
-                }
-                attempt_data['answers'].append(answer_data)
-            
-            exam_data['attempts'].append(attempt_data)
+        codec = available_codec(current_app.config.get('ARCHIVE_CODEC', 'gzip'))
+        payload, index, stats = encode_records(iter_exam_records(exam), codec)
 
         archive = ArchivedExam(
             exam_id=exam.exam_id,
             course_id=exam.course_id,
             exam_name=exam.exam_name,
-            exam_data=json.dumps(exam_data),
+            payload=payload,
+            payload_codec=codec,
+            payload_index=json.dumps(index, separators=(',', ':')),
+            raw_bytes=stats['raw_bytes'],
+            stored_bytes=stats['stored_bytes'],
+            archive_seconds=stats['seconds'],
             archived_by=archived_by,
             archive_reason=reason
         )
@@ -97,138 +67,276 @@ def archive_exam(exam_id, archived_by, reason):
         
 
         exam.is_active = False
-        db.session.commit()
+        db.session.flush()
 
-        audit_log = AuditLog(
+        audit.record(
             user_id=archived_by,
             action='archive_exam',
             entity_type='exam',
             entity_id=exam.exam_id,
-            new_values=str({
+            new_values={
                 'archive_id': archive.archive_id,
-                'reason': reason
-            }),
-            ip_address=request.remote_addr if request else None,
-            user_agent=request.headers.get('User-Agent') if request else None
+                'reason': reason,
+                'attempts': stats['records'] - 1,
+                'raw_bytes': stats['raw_bytes'],
+                'stored_bytes': stats['stored_bytes']
+            },
+            sync=True
         )
-        db.session.add(audit_log)
         db.session.commit()
-        
+
+        current_app.logger.info(
+            f"Archived exam {exam.exam_id}: {stats['records'] - 1} attempts, "
+            f"{stats['raw_bytes']} -> {stats['stored_bytes']} bytes ({codec}) in {stats['seconds']:.2f}s"
+        )
         return True, "Exam archived successfully"
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Error archiving exam: {str(e)}")
         return False, str(e)
 
+def _archive_job_item(app, run_id, exam_id, days):
+    """Archive one exam for a job run in its own app context and session."""
+    with app.app_context():
+        started = perf_counter()
+        item = ArchiveJobItem.query.filter_by(run_id=run_id, exam_id=exam_id).first()
+        try:
+            item.status = 'running'
+            item.attempts = (item.attempts or 0) + 1
+            item.started_at = datetime.utcnow()
+            db.session.commit()
+
+            # A crash between the archive commit and the checkpoint must not archive twice.
+            if ArchivedExam.query.filter_by(exam_id=exam_id).first():
+                success, message = True, 'Already archived'
+            else:
+                success, message = archive_exam(exam_id, 1, f"Automatic archive after {days} days")
+
+            item = ArchiveJobItem.query.filter_by(run_id=run_id, exam_id=exam_id).first()
+            item.status = 'done' if success else 'failed'
+            item.error = None if success else message[:500]
+            item.finished_at = datetime.utcnow()
+            item.duration_seconds = perf_counter() - started
+            db.session.commit()
+            return success, item.duration_seconds
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error archiving exam {exam_id} in run {run_id}: {str(e)}")
+            return False, perf_counter() - started
+        finally:
+            db.session.remove()
+
 def auto_archive_old_exams():
-    """Automatically archive exams older than configured days."""
-    with scheduler.app.app_context():
+    """Archive exams older than the configured days across a worker pool.
+
+    Progress is checkpointed per exam in archive_job_items, so a run that
+    crashed or timed out is resumed by the next invocation.
+    """
+    app = scheduler.app
+    with app.app_context():
         try:
             days = current_app.config.get('EXAM_ARCHIVE_DAYS', 30)
-            archive_date = datetime.utcnow() - timedelta(days=days)
-            
-            exams_to_archive = Exam.query.filter(
-                and_(
-                    Exam.available_to < archive_date,
-                    Exam.is_active == True
+            workers = current_app.config.get('ARCHIVE_WORKERS', 4)
+            max_attempts = current_app.config.get('ARCHIVE_MAX_ATTEMPTS', 3)
+
+            run = ArchiveJobRun.query.filter_by(
+                job_name='auto_archive', status='running'
+            ).order_by(ArchiveJobRun.started_at.desc()).first()
+
+            if run:
+                current_app.logger.info(f"Resuming auto-archive run {run.run_id}")
+            else:
+                archive_date = datetime.utcnow() - timedelta(days=days)
+                exam_ids = [row[0] for row in db.session.query(Exam.exam_id).filter(
+                    and_(
+                        Exam.available_to < archive_date,
+                        Exam.is_active == True
+                    )
+                )]
+                run = ArchiveJobRun(
+                    job_name='auto_archive',
+                    status='running',
+                    started_at=datetime.utcnow(),
+                    total=len(exam_ids)
                 )
-            ).all()
-            
-            for exam in exams_to_archive:
-                archive_exam(exam.exam_id, 1, f"Automatic archive after {days} days")
-                
-            current_app.logger.info(f"Auto-archived {len(exams_to_archive)} exams")
+                db.session.add(run)
+                db.session.flush()
+                db.session.bulk_insert_mappings(ArchiveJobItem, [
+                    {'run_id': run.run_id, 'exam_id': exam_id, 'status': 'pending', 'attempts': 0}
+                    for exam_id in exam_ids
+                ])
+                db.session.commit()
+
+            run_id = run.run_id
+            pending = [row[0] for row in db.session.query(ArchiveJobItem.exam_id).filter(
+                ArchiveJobItem.run_id == run_id,
+                ArchiveJobItem.status != 'done',
+                ArchiveJobItem.attempts < max_attempts
+            )]
+            db.session.remove()
+
+            started = perf_counter()
+            durations = []
+            failures = 0
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='archive-worker') as pool:
+                for success, duration in pool.map(
+                    lambda exam_id: _archive_job_item(app, run_id, exam_id, days), pending
+                ):
+                    durations.append(duration)
+                    failures += 0 if success else 1
+            elapsed = perf_counter() - started
+
+            run = ArchiveJobRun.query.get(run_id)
+            run.completed = ArchiveJobItem.query.filter_by(run_id=run_id, status='done').count()
+            run.failed = run.total - run.completed
+            unfinished = ArchiveJobItem.query.filter(
+                ArchiveJobItem.run_id == run_id,
+                ArchiveJobItem.status != 'done',
+                ArchiveJobItem.attempts < max_attempts
+            ).count()
+            if not unfinished:
+                run.status = 'completed' if not run.failed else 'completed_with_errors'
+                run.finished_at = datetime.utcnow()
+            db.session.commit()
+
+            current_app.logger.info(
+                f"Auto-archive run {run_id}: {len(pending) - failures}/{len(pending)} exams in "
+                f"{elapsed:.1f}s ({len(pending) / elapsed if elapsed else 0:.2f} exams/s, "
+                f"avg {sum(durations) / len(durations) if durations else 0:.2f}s, "
+                f"max {max(durations, default=0):.2f}s per exam)"
+            )
         except Exception as e:
+            db.session.rollback()
             current_app.logger.error(f"Error in auto_archive_old_exams: {str(e)}")
 
-def check_server_heartbeat():
-    """Check server health status."""
-    try:
-        heartbeat = Heartbeat(
-            component='server',
-            status='up',
-            message='Server is running'
-        )
-        db.session.add(heartbeat)
-        db.session.commit()
-        return True
-    except Exception as e:
-        heartbeat = Heartbeat(
-            component='server',
-            status='down',
-            message=f'Server error: {str(e)}'
-        )
-        db.session.add(heartbeat)
-        db.session.commit()
-        return False
+def tier_old_archives():
+    """Move archive payloads older than ARCHIVE_TIER_DAYS to the object store."""
+    with scheduler.app.app_context():
+        days = current_app.config.get('ARCHIVE_TIER_DAYS', 180)
+        batch_size = current_app.config.get('ARCHIVE_TIER_BATCH', 100)
+        codec = available_codec(current_app.config.get('ARCHIVE_CODEC', 'gzip'))
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        archive_ids = [row[0] for row in db.session.query(ArchivedExam.archive_id).filter(
+            ArchivedExam.archived_at < cutoff,
+            ArchivedExam.storage_location.is_(None)
+        ).order_by(ArchivedExam.archive_id).limit(batch_size)]
 
-def check_database_heartbeat():
-    """Check database health status."""
-    try:
-        result = db.session.execute('SELECT 1').fetchone()
-        if result and result[0] == 1:
-            heartbeat = Heartbeat(
-                component='database',
-                status='up',
-                message='Database is responsive'
+        started = perf_counter()
+        tiered = 0
+        moved_bytes = 0
+        for archive_id in archive_ids:
+            try:
+                archive = ArchivedExam.query.get(archive_id)
+                if tier_archive(archive, codec):
+                    db.session.commit()
+                    tiered += 1
+                    moved_bytes += archive.stored_bytes or 0
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"Error tiering archive {archive_id}: {str(e)}")
+
+        if archive_ids:
+            current_app.logger.info(
+                f"Tiered {tiered}/{len(archive_ids)} archives ({moved_bytes} bytes) "
+                f"to {current_app.config.get('ARCHIVE_STORE', 'local')} in {perf_counter() - started:.1f}s"
             )
-            db.session.add(heartbeat)
-            db.session.commit()
-            return True
-    except Exception as e:
-        heartbeat = Heartbeat(
-            component='database',
-            status='down',
-            message=f'Database error: {str(e)}'
-        )
-        db.session.add(heartbeat)
-        db.session.commit()
-        return False
 
-def check_client_heartbeat(client_ip):
-    """Check client health status."""
-    try:
-        heartbeat = Heartbeat(
-            component='client',
-            status='up',
-            message=f'Client {client_ip} last seen'
-        )
-        db.session.add(heartbeat)
-        db.session.commit()
-        return True
-    except Exception as e:
-        heartbeat = Heartbeat(
-            component='client',
-            status='down',
-            message=f'Client error: {str(e)}'
-        )
-        db.session.add(heartbeat)
-        db.session.commit()
-        return False
+def sweep_expired_attempts():
+    """Auto-submit in-progress attempts whose deadline has passed."""
+    from app.deadlines import deadline_sweeper
+    with scheduler.app.app_context():
+        deadline_sweeper.sweep()
+
+def flush_autosaved_answers():
+    """Write buffered autosave deltas to the answers table."""
+    from app.autosave import autosave_buffer
+    with scheduler.app.app_context():
+        autosave_buffer.flush()
+
+def renew_scheduler_lease():
+    """Renew or take over the scheduler leader lease."""
+    from app.leader import leader
+    from app.deadlines import deadline_sweeper
+    with scheduler.app.app_context():
+        if not leader.renew():
+            # Only the leader sweeps; drop the heap so a later takeover starts from a full load.
+            deadline_sweeper.reset()
 
 def init_scheduled_tasks(app):
-    """Initialize all scheduled background tasks."""
+    """Initialize all scheduled background tasks.
+
+    Every process runs the jobs that work on its own in-memory state;
+    cluster-wide jobs are wrapped with leader_only() and run only in the
+    process holding the scheduler lease.
+    """
+    from app.heartbeat import run_scheduled_checks, flush_heartbeat_rollups, flush_presence_transitions
+    from app.exam_session import refresh_revocations
+    from app.leader import leader, leader_only, timed
+    if scheduler.running:
+        return
     scheduler.app = app
+    leader.init_app(app)
 
     scheduler.add_job(
-        func=check_server_heartbeat,
-        trigger=IntervalTrigger(minutes=5),
-        id='server_heartbeat',
-        name='Check server status every 5 minutes',
+        func=renew_scheduler_lease,
+        trigger=IntervalTrigger(seconds=app.config.get('SCHEDULER_LEASE_RENEW', 10)),
+        next_run_time=datetime.now(),
+        id='scheduler_lease',
+        name='Renew scheduler leader lease',
         replace_existing=True
     )
-    
+
+    scheduler.add_job(
+        func=leader_only('heartbeat_checks', run_scheduled_checks),
+        trigger=IntervalTrigger(seconds=app.config.get('HEARTBEAT_INTERVAL', 300)),
+        id='heartbeat_checks',
+        name='Check server and database status',
+        replace_existing=True
+    )
+
+    scheduler.add_job(
+        func=timed('heartbeat_rollups', flush_heartbeat_rollups),
+        trigger=IntervalTrigger(minutes=1),
+        id='heartbeat_rollups',
+        name='Write per-minute heartbeat rollups',
+        replace_existing=True
+    )
+
+    scheduler.add_job(
+        func=timed('presence_transitions', flush_presence_transitions),
+        trigger=IntervalTrigger(seconds=app.config.get('CLIENT_PRESENCE_FLUSH_SECONDS', 10)),
+        id='presence_transitions',
+        name='Persist client presence transitions',
+        replace_existing=True
+    )
+
+    scheduler.add_job(
+        func=timed('flush_autosave', flush_autosaved_answers),
+        trigger=IntervalTrigger(seconds=app.config.get('AUTOSAVE_FLUSH_SECONDS', 5)),
+        id='flush_autosave',
+        name='Flush autosaved answers',
+        replace_existing=True
+    )
+
     scheduler.add_job(
-        func=check_database_heartbeat,
-        trigger=IntervalTrigger(minutes=5),
-        id='database_heartbeat',
-        name='Check database status every 5 minutes',
+        func=leader_only('sweep_expired_attempts', sweep_expired_attempts),
+        trigger=IntervalTrigger(seconds=app.config.get('EXAM_SWEEP_SECONDS', 5)),
+        id='sweep_expired_attempts',
+        name='Auto-submit expired exam attempts',
+        replace_existing=True
+    )
+
+    scheduler.add_job(
+        func=timed('exam_session_revocations', refresh_revocations),
+        trigger=IntervalTrigger(seconds=app.config.get('EXAM_SESSION_REVOCATION_REFRESH', 15)),
+        id='exam_session_revocations',
+        name='Reload revoked exam-session tokens',
         replace_existing=True
     )
     
 
     scheduler.add_job(
-        func=auto_archive_old_exams,
+        func=leader_only('auto_archive_exams', auto_archive_old_exams),
         trigger='cron',
         hour=2,
         minute=0,
@@ -236,6 +344,16 @@ def init_scheduled_tasks(app):
         name='Auto-archive old exams daily at 2 AM',
         replace_existing=True
     )
+
+    scheduler.add_job(
+        func=leader_only('tier_old_archives', tier_old_archives),
+        trigger='cron',
+        hour=3,
+        minute=0,
+        id='tier_old_archives',
+        name='Move old archive payloads to cold storage daily at 3 AM',
+        replace_existing=True
+    )
     
     
     scheduler.start()
@@ -68,7 +68,9 @@ def create_app(config_class=Config):
     
     return app
 
-app = create_app()
-
 if __name__ == '__main__':
-    app.run(ssl_context='adhoc')
\ No newline at end of file
+    app = create_app()
+    app.run(ssl_context='adhoc')
+elif __name__ != '__mp_main__':
+    # Password hashing pool processes re-run this script as __mp_main__; they must not build an app.
+    app = create_app()
\ No newline at end of file
@@ -3,6 +3,7 @@ import os
 from dotenv import load_dotenv
 import hashlib
 import secrets
+import time
 
 # Load environment variables
 load_dotenv()
@@ -16,6 +17,162 @@ driver = '{ODBC Driver 17 for SQL Server}'
 
 connection_string = f"DRIVER={driver};SERVER={server};DATABASE={database};UID={username};PWD={password}"
 
+# Engine editions that can build indexes online: Enterprise/Developer, Azure SQL Database, Managed Instance.
+ONLINE_INDEX_EDITIONS = (3, 5, 8)
+
+
+def supports_online_index(cursor):
+    cursor.execute("SELECT CAST(SERVERPROPERTY('EngineEdition') AS INT)")
+    return cursor.fetchone()[0] in ONLINE_INDEX_EDITIONS
+
+
+def create_index(cursor, name, table, columns, unique=False, include=None, where=None, online=False):
+    """Create an index unless one with this name already exists on the table."""
+    cursor.execute(
+        "SELECT 1 FROM sys.indexes WHERE name = ? AND object_id = OBJECT_ID(?)", (name, table)
+    )
+    if cursor.fetchone():
+        return
+    sql = f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table}({columns})"
+    if include:
+        sql += f" INCLUDE ({include})"
+    if where:
+        sql += f" WHERE {where}"
+    if online:
+        sql += " WITH (ONLINE = ON)"
+    cursor.execute(sql)
+
+
+def drop_index(cursor, name, table):
+    cursor.execute(f"""
+    IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = '{name}' AND object_id = OBJECT_ID('{table}'))
+    DROP INDEX {name} ON {table}
+    """)
+
+
+def m001_archive_payload_columns(cursor, online):
+    cursor.execute("""
+    IF COL_LENGTH('archived_exams', 'payload') IS NULL
+    ALTER TABLE archived_exams ADD
+        payload VARBINARY(MAX),
+        payload_codec NVARCHAR(20),
+        raw_bytes BIGINT,
+        stored_bytes BIGINT,
+        archive_seconds FLOAT
+    """)
+    cursor.execute("""
+    IF COL_LENGTH('archived_exams', 'payload_index') IS NULL
+    ALTER TABLE archived_exams ADD payload_index NVARCHAR(MAX)
+    """)
+
+
+def m002_archive_storage_columns(cursor, online):
+    cursor.execute("""
+    IF COL_LENGTH('archived_exams', 'storage_location') IS NULL
+    ALTER TABLE archived_exams ADD
+        storage_location NVARCHAR(500),
+        checksum CHAR(64),
+        tiered_at DATETIME
+    """)
+
+
+def m003_base_indexes(cursor, online):
+    create_index(cursor, 'idx_course_enrollments_user', 'course_enrollments', 'user_id', online=online)
+    create_index(cursor, 'idx_course_enrollments_course', 'course_enrollments', 'course_id', online=online)
+    create_index(cursor, 'idx_exams_course', 'exams', 'course_id', online=online)
+    create_index(cursor, 'idx_questions_exam', 'questions', 'exam_id', online=online)
+    create_index(cursor, 'idx_attempts_exam_user', 'exam_attempts', 'exam_id, user_id', online=online)
+
+
+def m004_attempts_in_progress_index(cursor, online):
+    # Filtered index for the deadline sweeper: only running attempts, ordered by start time.
+    create_index(cursor, 'idx_attempts_in_progress', 'exam_attempts', 'start_time',
+                 include='exam_id, user_id', where="status = 'in_progress'", online=online)
+
+
+def m005_unique_answers(cursor, online):
+    # Autosave races could leave several rows per question; keep the most recent one.
+    cursor.execute("""
+    WITH ranked AS (
+        SELECT ROW_NUMBER() OVER (
+            PARTITION BY attempt_id, question_id ORDER BY answer_id DESC
+        ) AS rn
+        FROM answers
+    )
+    DELETE FROM ranked WHERE rn > 1
+    """)
+    if cursor.rowcount and cursor.rowcount > 0:
+        print(f"    removed {cursor.rowcount} duplicate answers")
+    create_index(cursor, 'uq_answers_attempt_question', 'answers', 'attempt_id, question_id',
+                 unique=True, online=online)
+    # The unique index leads with attempt_id, so the single-column one is redundant.
+    drop_index(cursor, 'idx_answers_attempt', 'answers')
+
+
+def m006_hot_path_indexes(cursor, online):
+    create_index(cursor, 'idx_attempts_exam_status', 'exam_attempts',
+                 'exam_id, status, submission_time', online=online)
+    create_index(cursor, 'idx_audit_logs_created', 'audit_logs', 'created_at', online=online)
+    create_index(cursor, 'idx_heartbeats_component_time', 'heartbeats', 'component, timestamp', online=online)
+    create_index(cursor, 'idx_question_options_order', 'question_options',
+                 'question_id, display_order', online=online)
+
+
+def m007_exam_content_version(cursor, online):
+    cursor.execute("""
+    IF COL_LENGTH('exams', 'content_version') IS NULL
+    ALTER TABLE exams ADD content_version INT NOT NULL DEFAULT 0
+    """)
+
+
+# Append only; a version is never renumbered or edited once it has shipped.
+MIGRATIONS = [
+    (1, 'archived_exams payload columns', m001_archive_payload_columns),
+    (2, 'archived_exams object storage columns', m002_archive_storage_columns),
+    (3, 'base lookup indexes', m003_base_indexes),
+    (4, 'filtered in-progress attempts index', m004_attempts_in_progress_index),
+    (5, 'unique answer per attempt and question', m005_unique_answers),
+    (6, 'hot path indexes for attempts, audit logs, heartbeats and options', m006_hot_path_indexes),
+    (7, 'exams content version for cache invalidation', m007_exam_content_version),
+]
+
+
+def run_migrations(conn):
+    """Apply every migration not yet recorded in schema_migrations, each in its own transaction.
+
+    Steps are written to be safe to re-run, so a migration that failed half
+    way can simply be retried. Returns the versions applied by this run.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in cursor.fetchall()}
+    online = supports_online_index(cursor)
+    print(f"Online index builds {'enabled' if online else 'not supported by this edition'}")
+
+    ran = []
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        started = time.perf_counter()
+        try:
+            migrate(cursor, online)
+            duration_ms = int((time.perf_counter() - started) * 1000)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, description, duration_ms) VALUES (?, ?, ?)",
+                (version, description, duration_ms)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            print(f"  {version:03d} {description}: FAILED")
+            raise
+        print(f"  {version:03d} {description}: {duration_ms} ms")
+        ran.append(version)
+
+    print(f"Applied {len(ran)} migrations" if ran else "Schema is up to date")
+    return ran
+
+
 def create_tables():
     conn = None
     try:
@@ -85,7 +242,8 @@ def create_tables():
             ip_restriction NVARCHAR(255),
             browser_lockdown BIT DEFAULT 0,
             show_results_immediately BIT DEFAULT 0,
-            show_results_after DATETIME
+            show_results_after DATETIME,
+            content_version INT NOT NULL DEFAULT 0  -- bumped on question/option edits; keys app caches
         )
         """)
 
@@ -152,13 +310,52 @@ def create_tables():
             exam_id INT,
             course_id INT,
             exam_name NVARCHAR(100),
-            exam_data NVARCHAR(MAX),  -- JSON representation of exam and results
+            exam_data NVARCHAR(MAX),  -- JSON representation of exam and results (legacy)
+            payload VARBINARY(MAX),  -- compressed newline-delimited JSON
+            payload_codec NVARCHAR(20),
+            payload_index NVARCHAR(MAX),  -- attempt_id/user_id -> member offsets in payload
+            raw_bytes BIGINT,
+            stored_bytes BIGINT,
+            archive_seconds FLOAT,
+            storage_location NVARCHAR(500),  -- object store location once tiered; payload is then NULL
+            checksum CHAR(64),  -- SHA-256 of the tiered payload
+            tiered_at DATETIME,
             archived_by INT FOREIGN KEY REFERENCES users(user_id),
             archived_at DATETIME DEFAULT GETDATE(),
             archive_reason NVARCHAR(100)
         )
         """)
         
+        cursor.execute("""
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='archive_job_runs' AND xtype='U')
+        CREATE TABLE archive_job_runs (
+            run_id INT IDENTITY(1,1) PRIMARY KEY,
+            job_name NVARCHAR(50) NOT NULL,
+            status NVARCHAR(30) NOT NULL DEFAULT 'running',
+            started_at DATETIME DEFAULT GETDATE(),
+            finished_at DATETIME,
+            total INT DEFAULT 0,
+            completed INT DEFAULT 0,
+            failed INT DEFAULT 0
+        )
+        """)
+        
+        cursor.execute("""
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='archive_job_items' AND xtype='U')
+        CREATE TABLE archive_job_items (
+            item_id INT IDENTITY(1,1) PRIMARY KEY,
+            run_id INT NOT NULL FOREIGN KEY REFERENCES archive_job_runs(run_id),
+            exam_id INT NOT NULL,
+            status NVARCHAR(20) NOT NULL DEFAULT 'pending',
+            attempts INT NOT NULL DEFAULT 0,
+            started_at DATETIME,
+            finished_at DATETIME,
+            duration_seconds FLOAT,
+            error NVARCHAR(500),
+            UNIQUE (run_id, exam_id)
+        )
+        """)
+        
         cursor.execute("""
         IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='audit_logs' AND xtype='U')
         CREATE TABLE audit_logs (
@@ -186,48 +383,154 @@ def create_tables():
         )
         """)
         
-        cursor.execute("CREATE INDEX idx_course_enrollments_user ON course_enrollments(user_id)")
-        cursor.execute("CREATE INDEX idx_course_enrollments_course ON course_enrollments(course_id)")
-        cursor.execute("CREATE INDEX idx_exams_course ON exams(course_id)")
-        cursor.execute("CREATE INDEX idx_questions_exam ON questions(exam_id)")
-        cursor.execute("CREATE INDEX idx_attempts_exam_user ON exam_attempts(exam_id, user_id)")
-        cursor.execute("CREATE INDEX idx_answers_attempt ON answers(attempt_id)")
+        cursor.execute("""
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='heartbeat_rollups' AND xtype='U')
+        CREATE TABLE heartbeat_rollups (
+            rollup_id INT IDENTITY(1,1) PRIMARY KEY,
+            component NVARCHAR(50) NOT NULL,
+            minute DATETIME NOT NULL,
+            up_count INT NOT NULL DEFAULT 0,
+            down_count INT NOT NULL DEFAULT 0,
+            last_status NVARCHAR(20),
+            last_message NVARCHAR(255),
+            latency_p50_ms FLOAT,
+            latency_p95_ms FLOAT,
+            latency_p99_ms FLOAT
+        )
+        """)
+        
+        cursor.execute("""
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='scheduler_leases' AND xtype='U')
+        CREATE TABLE scheduler_leases (
+            name NVARCHAR(50) PRIMARY KEY,
+            holder NVARCHAR(150) NOT NULL,  -- host:pid:nonce of the current leader
+            epoch INT NOT NULL DEFAULT 1,  -- bumped on every change of leader
+            acquired_at DATETIME2,
+            renewed_at DATETIME2,
+            expires_at DATETIME2 NOT NULL  -- UTC, compared with SYSUTCDATETIME()
+        )
+        """)
+        
+        cursor.execute("""
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='schema_migrations' AND xtype='U')
+        CREATE TABLE schema_migrations (
+            version INT PRIMARY KEY,
+            description NVARCHAR(200) NOT NULL,
+            applied_at DATETIME DEFAULT GETDATE(),
+            duration_ms INT
+        )
+        """)
+        
+        cursor.execute("""
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='revoked_tokens' AND xtype='U')
+        CREATE TABLE revoked_tokens (
+            token_id INT IDENTITY(1,1) PRIMARY KEY,
+            jti NVARCHAR(36) UNIQUE NOT NULL,  -- only refresh tokens are checked against this list
+            token_type NVARCHAR(10) NOT NULL,
+            user_id INT FOREIGN KEY REFERENCES users(user_id),
+            revoked_at DATETIME DEFAULT GETDATE(),
+            expires_at DATETIME
+        )
+        """)
         
         cursor.execute("""
         CREATE OR ALTER PROCEDURE sp_archive_old_exams
-            @days_old INT = 30
+            @days_old INT = 30,
+            @batch_size INT = 50,          -- exams per transaction
+            @pause CHAR(8) = '00:00:02'    -- WAITFOR DELAY between batches (hh:mm:ss)
         AS
         BEGIN
             SET NOCOUNT ON;
+            SET XACT_ABORT ON;
+            
+            DECLARE @cutoff DATETIME = DATEADD(day, -@days_old, GETDATE());
+            DECLARE @reason NVARCHAR(100) = 'Automatic archive after ' + CAST(@days_old AS NVARCHAR) + ' days';
+            DECLARE @batch_no INT = 0;
+            DECLARE @exams INT, @archived INT, @attempts INT, @started DATETIME2, @ms INT;
+            DECLARE @batch TABLE (exam_id INT PRIMARY KEY);
+            DECLARE @report TABLE (
+                batch_no INT, exams INT, archive_rows INT, attempts_updated INT,
+                duration_ms INT, finished_at DATETIME
+            );
             
-            BEGIN TRANSACTION;
-            BEGIN TRY
-                -- Archive exam attempts older than specified days
-                INSERT INTO archived_exams (exam_id, course_id, exam_name, exam_data, archived_by, archive_reason)
-                SELECT e.exam_id, e.course_id, e.exam_name, 
-                       (SELECT * FROM exam_attempts ea 
-                        JOIN answers a ON ea.attempt_id = a.attempt_id
-                        WHERE ea.exam_id = e.exam_id AND ea.status = 'graded'
-                        FOR JSON PATH) AS exam_data,
-                       1, 'Automatic archive after ' + CAST(@days_old AS NVARCHAR) + ' days'
+            WHILE 1 = 1
+            BEGIN
+                SET @started = SYSDATETIME();
+                DELETE FROM @batch;
+                
+                -- Next chunk of exams that still have old graded attempts
+                INSERT INTO @batch (exam_id)
+                SELECT TOP (@batch_size) e.exam_id
                 FROM exams e
-                JOIN exam_attempts ea ON e.exam_id = ea.exam_id
-                WHERE ea.submission_time < DATEADD(day, -@days_old, GETDATE())
-                AND ea.status = 'graded'
-                AND NOT EXISTS (SELECT 1 FROM archived_exams ae WHERE ae.exam_id = e.exam_id);
+                WHERE EXISTS (
+                    SELECT 1 FROM exam_attempts ea
+                    WHERE ea.exam_id = e.exam_id
+                    AND ea.status = 'graded'
+                    AND ea.submission_time < @cutoff
+                )
+                ORDER BY e.exam_id;
+                
+                SET @exams = @@ROWCOUNT;
+                IF @exams = 0 BREAK;
+                SET @batch_no = @batch_no + 1;
                 
-                -- Update status of archived attempts
-                UPDATE exam_attempts
-                SET status = 'archived'
-                WHERE submission_time < DATEADD(day, -@days_old, GETDATE())
-                AND status = 'graded';
+                BEGIN TRANSACTION;
+                BEGIN TRY
+                    -- One archive row per exam, in the same shape the application writes
+                    INSERT INTO archived_exams (exam_id, course_id, exam_name, exam_data, archived_by, archive_reason)
+                    SELECT e.exam_id, e.course_id, e.exam_name,
+                           (SELECT
+                                JSON_QUERY((SELECT e.exam_id, e.exam_name, e.course_id, e.created_at
+                                            FOR JSON PATH, WITHOUT_ARRAY_WRAPPER)) AS exam_info,
+                                JSON_QUERY(ISNULL((
+                                    SELECT ea.attempt_id, ea.user_id, ea.start_time, ea.submission_time, ea.total_score,
+                                           JSON_QUERY(ISNULL((
+                                               SELECT a.question_id, a.answer_text, a.selected_option_id,
+                                                      a.points_awarded, a.feedback, a.graded_at
+                                               FROM answers a
+                                               WHERE a.attempt_id = ea.attempt_id
+                                               ORDER BY a.question_id
+                                               FOR JSON PATH, INCLUDE_NULL_VALUES), '[]')) AS answers
+                                    FROM exam_attempts ea
+                                    WHERE ea.exam_id = e.exam_id AND ea.status = 'graded'
+                                    ORDER BY ea.attempt_id
+                                    FOR JSON PATH, INCLUDE_NULL_VALUES), '[]')) AS attempts
+                            FOR JSON PATH, WITHOUT_ARRAY_WRAPPER) AS exam_data,
+                           1, @reason
+                    FROM exams e
+                    JOIN @batch b ON b.exam_id = e.exam_id
+                    WHERE NOT EXISTS (SELECT 1 FROM archived_exams ae WHERE ae.exam_id = e.exam_id);
+                    
+                    SET @archived = @@ROWCOUNT;
+                    
+                    UPDATE ea
+                    SET status = 'archived'
+                    FROM exam_attempts ea
+                    JOIN @batch b ON b.exam_id = ea.exam_id
+                    WHERE ea.status = 'graded'
+                    AND ea.submission_time < @cutoff;
+                    
+                    SET @attempts = @@ROWCOUNT;
+                    
+                    COMMIT TRANSACTION;
+                END TRY
+                BEGIN CATCH
+                    IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION;
+                    THROW;
+                END CATCH
                 
-                COMMIT TRANSACTION;
-            END TRY
-            BEGIN CATCH
-                ROLLBACK TRANSACTION;
-                THROW;
-            END CATCH
+                SET @ms = DATEDIFF(millisecond, @started, SYSDATETIME());
+                INSERT INTO @report VALUES (@batch_no, @exams, @archived, @attempts, @ms, GETDATE());
+                -- Progress is streamed to the client immediately rather than at the end
+                RAISERROR('Batch %d: %d exams, %d archive rows, %d attempts in %d ms', 0, 1,
+                          @batch_no, @exams, @archived, @attempts, @ms) WITH NOWAIT;
+                
+                WAITFOR DELAY @pause;
+            END
+            
+            SELECT batch_no, exams, archive_rows, attempts_updated, duration_ms, finished_at
+            FROM @report
+            ORDER BY batch_no;
         END
         """)
         
@@ -245,6 +548,8 @@ def create_tables():
         conn.commit()
         print("Database tables created successfully!")
         
+        run_migrations(conn)
+        
     except Exception as e:
         print(f"Error creating tables: {e}")
         if conn: